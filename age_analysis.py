@@ -0,0 +1,133 @@
+# Age analysis snapshot pipeline
+# Stores the debtor age analysis as one compressed Parquet partition per financial period
+# and computes per-customer aging bucket movements between periods.
+
+import os
+import shutil
+import pandas as pd
+from importToBI3 import ClearVueBIProcessor
+
+AGE_ANALYSIS_COLLECTION = "age analysis"
+DEFAULT_SNAPSHOT_DIR = "./snapshots/age_analysis"
+
+AGING_BUCKETS = ClearVueBIProcessor.AGING_BUCKETS
+AGE_ANALYSIS_COLUMNS = ClearVueBIProcessor.AGE_ANALYSIS_COLUMNS
+AMOUNT_COLUMNS = ['TOTAL_DUE'] + AGING_BUCKETS
+
+
+class AgeAnalysisSnapshotStore:
+    """
+    Age analysis snapshots partitioned by FIN_PERIOD.
+    Each period lives in its own directory (FIN_PERIOD=YYYYMM/) so that reading
+    the latest snapshot or a single period only touches that partition.
+    """
+
+    def __init__(self, base_dir=DEFAULT_SNAPSHOT_DIR, compression="zstd"):
+        self.base_dir = base_dir
+        self.compression = compression
+
+    def partition_path(self, fin_period):
+        return os.path.join(self.base_dir, f"FIN_PERIOD={int(fin_period)}", "snapshot.parquet")
+
+    def write_snapshots(self, age_analysis):
+        """Write (or overwrite) one partition per FIN_PERIOD present in age_analysis"""
+        df = ClearVueBIProcessor.normalize_age_analysis(age_analysis)
+
+        written = []
+        for fin_period, snapshot in df.groupby('FIN_PERIOD', sort=True):
+            path = self.partition_path(fin_period)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            tmp_path = path + ".tmp"
+            snapshot.drop(columns='FIN_PERIOD').to_parquet(tmp_path, compression=self.compression, index=False)
+            os.replace(tmp_path, path)
+            written.append(int(fin_period))
+
+        return written
+
+    def sync_from_mongodb(self, processor, since_period=None):
+        """
+        Load the age analysis through the processor's projected extraction and write it as partitions.
+        With since_period only snapshots from that FIN_PERIOD onwards are read and rewritten.
+        """
+        query = {'FIN_PERIOD': {'$gte': since_period}} if since_period is not None else None
+        age_analysis = processor.load_collection(AGE_ANALYSIS_COLLECTION, AGE_ANALYSIS_COLUMNS, query)
+        return self.write_snapshots(age_analysis)
+
+    def list_periods(self):
+        """All FIN_PERIOD values that have a partition, oldest first"""
+        if not os.path.isdir(self.base_dir):
+            return []
+
+        periods = []
+        for entry in os.listdir(self.base_dir):
+            if entry.startswith("FIN_PERIOD=") and os.path.exists(self.partition_path(entry.split("=", 1)[1])):
+                periods.append(int(entry.split("=", 1)[1]))
+        return sorted(periods)
+
+    def latest_period(self):
+        periods = self.list_periods()
+        return periods[-1] if periods else None
+
+    def read_period(self, fin_period, columns=None):
+        """Read a single period's snapshot. Only that partition's file is opened."""
+        path = self.partition_path(fin_period)
+        if not os.path.exists(path):
+            raise KeyError(f"No age analysis snapshot for FIN_PERIOD {fin_period}")
+
+        if columns is not None:
+            # FIN_PERIOD is encoded in the partition directory, not stored in the file
+            columns = [col for col in columns if col != 'FIN_PERIOD']
+
+        snapshot = pd.read_parquet(path, columns=columns)
+        snapshot['FIN_PERIOD'] = int(fin_period)
+        return snapshot
+
+    def read_latest(self, columns=None):
+        fin_period = self.latest_period()
+        if fin_period is None:
+            return pd.DataFrame(columns=columns or AGE_ANALYSIS_COLUMNS)
+        return self.read_period(fin_period, columns)
+
+    def read_periods(self, start_period=None, end_period=None, columns=None):
+        """Read every partition between start_period and end_period (inclusive)"""
+        periods = [
+            p for p in self.list_periods()
+            if (start_period is None or p >= start_period) and (end_period is None or p <= end_period)
+        ]
+        if not periods:
+            return pd.DataFrame(columns=columns or AGE_ANALYSIS_COLUMNS)
+        return pd.concat([self.read_period(p, columns) for p in periods], ignore_index=True)
+
+    def aging_deltas(self, from_period, to_period):
+        """
+        Per-customer change in every aging bucket between two periods.
+        Customers missing from one of the snapshots are treated as having a zero balance there.
+        """
+        columns = ['CUSTOMER_NUMBER'] + AMOUNT_COLUMNS
+        before = self.read_period(from_period, columns).set_index('CUSTOMER_NUMBER')[AMOUNT_COLUMNS]
+        after = self.read_period(to_period, columns).set_index('CUSTOMER_NUMBER')[AMOUNT_COLUMNS]
+
+        customers = before.index.union(after.index)
+        before = before.reindex(customers, fill_value=0.0)
+        after = after.reindex(customers, fill_value=0.0)
+
+        deltas = after.sub(before)
+        deltas.columns = [f"{col}_DELTA" for col in AMOUNT_COLUMNS]
+        deltas = deltas.reset_index().rename(columns={'index': 'CUSTOMER_NUMBER'})
+
+        deltas.insert(1, 'FROM_FIN_PERIOD', int(from_period))
+        deltas.insert(2, 'TO_FIN_PERIOD', int(to_period))
+        return deltas
+
+    def drop_period(self, fin_period):
+        shutil.rmtree(os.path.dirname(self.partition_path(fin_period)), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    store = AgeAnalysisSnapshotStore()
+    latest = store.latest_period()
+
+    # Rewrite the latest stored period too, in case it was still open when last synced
+    written = store.sync_from_mongodb(ClearVueBIProcessor(), since_period=latest)
+    print(f"Wrote {len(written)} age analysis partitions to {store.base_dir}")
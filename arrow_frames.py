@@ -0,0 +1,36 @@
+# Arrow helpers shared by the batch ETL, the partitioned sales fact build and the BI warm worker
+# (DataFrame <-> Arrow table / IPC stream bytes).
+
+import pandas as pd
+import pyarrow as pa
+
+
+def to_arrow_table(df):
+    """
+    Convert a dataset to Arrow. Object columns that mix types (e.g. codes that are
+    int in one collection and str in another) are sent as strings.
+    """
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        df = df.copy()
+        for col in df.columns[df.dtypes == object]:
+            try:
+                pa.array(df[col], from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                df[col] = df[col].map(lambda value: None if pd.isna(value) else str(value))
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def serialize_frame(df):
+    """Serialize a DataFrame to Arrow IPC stream bytes"""
+    table = to_arrow_table(df)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def deserialize_frame(payload):
+    """Read Arrow IPC stream bytes back into a DataFrame"""
+    return pa.ipc.open_stream(pa.py_buffer(payload)).read_pandas()
@@ -10,18 +10,24 @@ Description: Ingests 17 Excel (.xlsx) source files, applies FY logic, loads into
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from pymongo import MongoClient
 import logging
 import os
 import sys
 
+# Shared modules (stage timing, ...) live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipeline_metrics import instrument, metrics
+from mongo_access import bulk_load, get_client, write_batches
+from source_schema import SCHEMA_ERRORS, conform, read_source_table, share_key_categories
+
 # ===========================
 # CONFIGURATION
 # ===========================
 
-MONGO_URI = "mongodb://localhost:27017/"  # 🔑 REPLACE WITH YOUR URI
+MONGO_URI = os.environ.get("MONGODB_URI", "mongodb://localhost:27017/")  # 🔑 REPLACE WITH YOUR URI
 DB_NAME = "clearvue_bi"
 COLLECTION_NAME = "sales_fact"
+COMPACT_COLLECTION_NAME = "sales_fact_compact"
 
 DATA_DIR = "./exceldata"  # 📁 Folder containing your 17 .xlsx files
 
@@ -98,6 +104,7 @@ def fin_period_to_clearvue_fy(fin_period):
 # DATA LOADING & TRANSFORMATION — EXCEL VERSION
 # ===========================
 
+@instrument("etl.load_data")
 def load_data():
     """Load all 17 Excel source files into DataFrames."""
     logger.info("📂 Loading Excel source files...")
@@ -131,20 +138,26 @@ def load_data():
             continue
 
         try:
-            # Try reading with openpyxl (default for .xlsx)
-            dfs[name] = pd.read_excel(filepath, engine='openpyxl')
+            # Stream with openpyxl and cast to the declared source schema
+            dfs[name], mismatched = read_source_table(filepath, name)
             logger.info(f"✅ Loaded {name} with {len(dfs[name])} rows")
         except Exception as e:
             logger.warning(f"⚠️  Failed with openpyxl for {filename}: {e}. Trying xlrd...")
             try:
                 # Fallback to xlrd (for older .xls or some .xlsx)
-                dfs[name] = pd.read_excel(filepath, engine='xlrd')
+                dfs[name], mismatched = conform(pd.read_excel(filepath, engine='xlrd', dtype=object), name)
                 logger.info(f"✅ Loaded {name} with xlrd engine")
             except Exception as e2:
                 logger.error(f"❌ Failed to load {filename} with any engine: {e2}")
+                continue
+
+        if len(mismatched):
+            logger.warning(f"⚠️  {len(mismatched)} {name} rows did not match the schema ({SCHEMA_ERRORS})")
 
-    return dfs
+    # Same categorical dtype for each key column across tables, so the joins compare integer codes
+    return share_key_categories(dfs)
 
+@instrument("etl.transform_sales_data")
 def transform_sales_data(dfs):
     """Join sales data with dimensions and apply FY logic."""
     logger.info("🔗 Joining sales data with dimensions...")
@@ -190,7 +203,9 @@ def transform_sales_data(dfs):
     # Add customer info
     if 'customer' in dfs:
         cust_cols = ['CUSTOMER_NUMBER', 'REGION_CODE', 'REP_CODE', 'CREDIT_LIMIT', 'CCAT_CODE']
-        cust_cols = [c for c in cust_cols if c in dfs['customer'].columns]
+        # Sales Header carries the document's own REP_CODE; keep it rather than the customer's default rep
+        cust_cols = [c for c in cust_cols
+                     if c in dfs['customer'].columns and (c == 'CUSTOMER_NUMBER' or c not in merged.columns)]
         merged = merged.merge(dfs['customer'][cust_cols], on='CUSTOMER_NUMBER', how='left')
         logger.info("   → Added customer info")
 
@@ -224,6 +239,9 @@ def transform_sales_data(dfs):
     }
     for col, val in fill_values.items():
         if col in merged.columns:
+            # Categorical keys only accept existing categories as fill values
+            if isinstance(merged[col].dtype, pd.CategoricalDtype):
+                merged[col] = merged[col].astype(object)
             merged[col] = merged[col].fillna(val)
 
     # Apply Financial Year Logic
@@ -236,6 +254,7 @@ def transform_sales_data(dfs):
     logger.info(f"📊 Final merged dataset: {len(merged)} rows")
     return merged
 
+@instrument("etl.create_mongo_documents")
 def create_mongo_documents(df):
     """Convert DataFrame rows to MongoDB sales_fact documents."""
     logger.info("📄 Creating MongoDB documents...")
@@ -304,30 +323,35 @@ def create_mongo_documents(df):
 # MONGODB LOADING
 # ===========================
 
+def create_indexes(collection):
+    """Create the sales_fact reporting indexes."""
+    logger.info("🔧 Creating indexes...")
+    collection.create_index([("financial_year", 1), ("financial_month", 1)])
+    collection.create_index([("customer.region.code", 1)])
+    collection.create_index([("product.category.brand.code", 1)])
+    collection.create_index([("trans_date", 1)])
+    collection.create_index([("doc_number", 1)])
+
+    logger.info("✅ Indexes created successfully")
+
+@instrument("etl.load_to_mongodb")
 def load_to_mongodb(docs):
     """Insert documents into MongoDB and create indexes."""
     logger.info("☁️  Connecting to MongoDB Atlas...")
     try:
-        client = MongoClient(MONGO_URI)
+        client = get_client(MONGO_URI)
         db = client[DB_NAME]
         collection = db[COLLECTION_NAME]
 
         if docs:
-            result = collection.insert_many(docs)
-            logger.info(f"✅ Inserted {len(result.inserted_ids)} documents into {DB_NAME}.{COLLECTION_NAME}")
+            stats = bulk_load(collection, docs, sink="sales_fact")
+            logger.info(f"✅ Inserted {stats['documents']} documents into {DB_NAME}.{COLLECTION_NAME} "
+                        f"({stats['profile']} profile, {stats['batches']} batches, {stats['docs_per_second']:.0f} docs/s)")
         else:
             logger.warning("⚠️  No documents to insert")
             return
 
-        # Create indexes
-        logger.info("🔧 Creating indexes...")
-        collection.create_index([("financial_year", 1), ("financial_month", 1)])
-        collection.create_index([("customer.region.code", 1)])
-        collection.create_index([("product.category.brand.code", 1)])
-        collection.create_index([("trans_date", 1)])
-        collection.create_index([("doc_number", 1)])
-
-        logger.info("✅ Indexes created successfully")
+        create_indexes(collection)
 
         # Validation
         total_in_db = collection.count_documents({})
@@ -337,25 +361,414 @@ def load_to_mongodb(docs):
         logger.error(f"❌ MongoDB Error: {e}")
         raise
 
+# ===========================
+# COMPACT LAYOUT
+# ===========================
+
+# Compact fact documents only hold short numeric dimension keys plus measures.
+# Short field name -> field name in the nested sales_fact layout
+COMPACT_FIELDS = {
+    'd': 'doc_number', 'ts': 'trans_date', 'fy': 'financial_year', 'fm': 'financial_month',
+    'fq': 'financial_quarter', 'c': 'customer', 'p': 'product', 'tt': 'transaction_type',
+    'q': 'quantity', 'up': 'unit_sell_price', 'tp': 'total_line_price'
+}
+
+# Dimension name -> (collection, natural key field)
+# The rep is per document (Sales Header REP_CODE), not per customer, so it is its own dimension
+DIMENSION_COLLECTIONS = {
+    'customer': ('dim_customer', 'customer_number'),
+    'product': ('dim_product', 'inventory_code'),
+    'rep': ('dim_rep', 'code')
+}
+TRANS_TYPE_COLLECTION = 'dim_trans_type'
+
+def _text(df, col, default="Unknown"):
+    if col not in df.columns:
+        return pd.Series(default, index=df.index, dtype=object)
+    return df[col].astype(object).where(df[col].notna(), None).map(lambda v: default if v is None else str(v))
+
+def _number(df, col, dtype=float):
+    if col not in df.columns:
+        return pd.Series(0, index=df.index).astype(dtype)
+    return pd.to_numeric(df[col].astype(object), errors='coerce').fillna(0).astype(dtype)
+
+def _nullable_int(df, col):
+    values = pd.to_numeric(df[col].astype(object), errors='coerce') if col in df.columns else pd.Series(index=df.index, dtype=float)
+    return values.astype(object).where(values.notna(), None).map(lambda v: None if v is None else int(v))
+
+def assign_dimension_keys(natural_keys, existing=None):
+    """
+    Map natural keys to small integer keys. Keys already in `existing` (natural key -> int key)
+    are kept, so fact documents loaded earlier stay valid; new values get the next free keys.
+    """
+    existing = dict(existing or {})
+    next_key = max(existing.values(), default=0) + 1
+    for value in pd.unique(natural_keys):
+        if value not in existing:
+            existing[value] = next_key
+            next_key += 1
+    return existing
+
+def load_dimension_keys(db):
+    """Natural key -> int key maps for every compact dimension already stored in MongoDB."""
+    return {
+        name: {doc[natural_key]: doc['_id'] for doc in db[collection].find({}, {natural_key: 1})}
+        for name, (collection, natural_key) in DIMENSION_COLLECTIONS.items()
+    }
+
+@instrument("etl.create_compact_documents")
+def create_compact_documents(df, key_maps=None):
+    """
+    Build compact sales_fact documents plus the dimension documents they reference.
+    Columns are converted once per column instead of once per row.
+    Returns (fact_docs, dimension_docs) where dimension_docs maps collection -> documents.
+    """
+    logger.info("📄 Creating compact MongoDB documents...")
+    key_maps = key_maps or {}
+
+    customer_number = _text(df, 'CUSTOMER_NUMBER', default="None")
+    inventory_code = _text(df, 'INVENTORY_CODE', default="None")
+    rep_code = _text(df, 'REP_CODE')
+    customer_keys = assign_dimension_keys(customer_number, key_maps.get('customer'))
+    product_keys = assign_dimension_keys(inventory_code, key_maps.get('product'))
+    rep_keys = assign_dimension_keys(rep_code, key_maps.get('rep'))
+
+    trans_date = df['TRANS_DATE'] if 'TRANS_DATE' in df.columns else pd.Series(pd.NaT, index=df.index)
+    trans_date = pd.to_datetime(trans_date, errors='coerce')
+    facts = pd.DataFrame({
+        'd': _text(df, 'DOC_NUMBER', default="None"),
+        'ts': trans_date.astype(object).where(trans_date.notna(), None),
+        'fy': _nullable_int(df, 'financial_year'),
+        'fm': _nullable_int(df, 'financial_month'),
+        'fq': _nullable_int(df, 'financial_quarter'),
+        'c': customer_number.map(customer_keys),
+        'p': inventory_code.map(product_keys),
+        'r': rep_code.map(rep_keys),
+        'tt': _number(df, 'TRANSTYPE_CODE', int),
+        'q': _number(df, 'QUANTITY', int),
+        'up': _number(df, 'UNIT_SELL_PRICE'),
+        'tp': _number(df, 'TOTAL_LINE_PRICE')
+    })
+    fact_docs = facts.to_dict(orient="records")
+
+    customers = pd.DataFrame({
+        '_id': customer_number.map(customer_keys),
+        'customer_number': customer_number,
+        'region_code': _text(df, 'REGION_CODE'), 'region_desc': _text(df, 'REGION_DESC'),
+        'category_code': _number(df, 'CCAT_CODE', int),
+        'credit_limit': _number(df, 'CREDIT_LIMIT')
+    }).drop_duplicates('_id')
+    customer_docs = [
+        {
+            '_id': r['_id'], 'customer_number': r['customer_number'],
+            'region': {'code': r['region_code'], 'desc': r['region_desc']},
+            'category_code': r['category_code'],
+            'credit_limit': r['credit_limit']
+        }
+        for r in customers.to_dict(orient="records")
+    ]
+
+    reps = pd.DataFrame({
+        '_id': rep_code.map(rep_keys), 'code': rep_code, 'desc': _text(df, 'REP_DESC')
+    }).drop_duplicates('_id')
+
+    products = pd.DataFrame({
+        '_id': inventory_code.map(product_keys),
+        'inventory_code': inventory_code,
+        'category_code': _number(df, 'PRODCAT_CODE', int), 'category_desc': _text(df, 'PRODCAT_DESC'),
+        'brand_code': _number(df, 'BRAND_CODE', int), 'brand_desc': _text(df, 'PRODBRA_DESC'),
+        'range_code': _number(df, 'PRAN_CODE', int), 'range_desc': _text(df, 'PRAN_DESC'),
+        'gender': _text(df, 'GENDER'), 'material': _text(df, 'MATERIAL'), 'style': _text(df, 'STYLE'),
+        'last_cost': _number(df, 'LAST_COST')
+    }).drop_duplicates('_id')
+    product_docs = [
+        {
+            '_id': r['_id'], 'inventory_code': r['inventory_code'],
+            'category': {
+                'code': r['category_code'], 'desc': r['category_desc'],
+                'brand': {'code': r['brand_code'], 'desc': r['brand_desc']},
+                'range': {'code': r['range_code'], 'desc': r['range_desc']}
+            },
+            'style': {'gender': r['gender'], 'material': r['material'], 'style': r['style']},
+            'last_cost': r['last_cost']
+        }
+        for r in products.to_dict(orient="records")
+    ]
+
+    trans_types = pd.DataFrame({
+        '_id': _number(df, 'TRANSTYPE_CODE', int), 'desc': _text(df, 'TRANSTYPE_DESC')
+    }).drop_duplicates('_id')
+
+    logger.info(f"✅ Created {len(fact_docs)} compact documents, {len(customer_docs)} customers, "
+                f"{len(product_docs)} products, {len(reps)} reps")
+    return fact_docs, {
+        DIMENSION_COLLECTIONS['customer'][0]: customer_docs,
+        DIMENSION_COLLECTIONS['product'][0]: product_docs,
+        DIMENSION_COLLECTIONS['rep'][0]: reps.to_dict(orient="records"),
+        TRANS_TYPE_COLLECTION: trans_types.to_dict(orient="records")
+    }
+
+class DimensionCache:
+    """
+    In-process cache of the compact dimension collections. Each collection is read once,
+    after which resolving a compact fact document back to the nested layout is pure dict lookups.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._dimensions = None
+
+    def load(self):
+        self._dimensions = {
+            name: {doc['_id']: doc for doc in self.db[collection].find()}
+            for name, (collection, _) in DIMENSION_COLLECTIONS.items()
+        }
+        self._dimensions['transaction_type'] = {doc['_id']: doc for doc in self.db[TRANS_TYPE_COLLECTION].find()}
+        return self
+
+    def invalidate(self):
+        self._dimensions = None
+
+    def resolve(self, doc):
+        """Expand a compact fact document into the nested sales_fact layout."""
+        if self._dimensions is None:
+            self.load()
+
+        resolved = {COMPACT_FIELDS.get(field, field): value for field, value in doc.items() if field != 'r'}
+        resolved['line_seq'] = 1
+        customer = self._dimensions['customer'].get(doc.get('c'), {})
+        product = self._dimensions['product'].get(doc.get('p'), {})
+        trans_type = self._dimensions['transaction_type'].get(doc.get('tt'), {})
+
+        resolved['customer'] = {k: v for k, v in customer.items() if k != '_id'}
+        if 'r' in doc:
+            rep = self._dimensions['rep'].get(doc['r'], {})
+            resolved['customer']['rep'] = {'code': rep.get('code', "Unknown"), 'desc': rep.get('desc', "Unknown")}
+        resolved['product'] = {k: v for k, v in product.items() if k != '_id'}
+        resolved['transaction_type'] = {'code': doc.get('tt'), 'desc': trans_type.get('desc', "Unknown")}
+        return resolved
+
+    def find(self, query=None, projection=None):
+        """Query the compact collection and yield resolved documents."""
+        for doc in self.db[COMPACT_COLLECTION_NAME].find(query or {}, projection):
+            yield self.resolve(doc)
+
+@instrument("etl.load_compact_to_mongodb")
+def load_compact_to_mongodb(df):
+    """Build and insert compact fact documents; dimension documents are upserted by key."""
+    from pymongo import ReplaceOne
+
+    client = get_client(MONGO_URI)
+    db = client[DB_NAME]
+
+    fact_docs, dimension_docs = create_compact_documents(df, load_dimension_keys(db))
+    for collection_name, docs in dimension_docs.items():
+        if docs:
+            db[collection_name].bulk_write([ReplaceOne({'_id': d['_id']}, d, upsert=True) for d in docs], ordered=False)
+    if DIMENSION_COLLECTIONS['customer'][0] in dimension_docs:
+        db[DIMENSION_COLLECTIONS['customer'][0]].create_index([("customer_number", 1)], unique=True)
+        db[DIMENSION_COLLECTIONS['product'][0]].create_index([("inventory_code", 1)], unique=True)
+        db[DIMENSION_COLLECTIONS['rep'][0]].create_index([("code", 1)], unique=True)
+
+    collection = db[COMPACT_COLLECTION_NAME]
+    if fact_docs:
+        stats = bulk_load(collection, fact_docs, sink="sales_fact_compact")
+        logger.info(f"✅ Inserted {stats['documents']} documents into {DB_NAME}.{COMPACT_COLLECTION_NAME} "
+                    f"({stats['profile']} profile, {stats['batches']} batches, {stats['docs_per_second']:.0f} docs/s)")
+
+    collection.create_index([("fy", 1), ("fm", 1)])
+    collection.create_index([("c", 1)])
+    collection.create_index([("p", 1)])
+    collection.create_index([("r", 1)])
+    collection.create_index([("ts", 1)])
+    collection.create_index([("d", 1)])
+
+def compare_layouts():
+    """Report storage size and full-scan speed of the nested vs the compact layout."""
+    import time
+
+    db = get_client(MONGO_URI)[DB_NAME]
+    report = {}
+    for layout, collection_name in (('nested', COLLECTION_NAME), ('compact', COMPACT_COLLECTION_NAME)):
+        stats = db.command('collStats', collection_name)
+        report[layout] = {
+            'documents': stats.get('count', 0),
+            'data_bytes': stats.get('size', 0),
+            'storage_bytes': stats.get('storageSize', 0),
+            'avg_document_bytes': stats.get('avgObjSize', 0),
+            'index_bytes': stats.get('totalIndexSize', 0)
+        }
+
+        started = time.perf_counter()
+        scanned = sum(1 for _ in db[collection_name].find())
+        report[layout]['scan_seconds'] = time.perf_counter() - started
+        report[layout]['scanned'] = scanned
+
+    cache = DimensionCache(db).load()
+    started = time.perf_counter()
+    sum(1 for _ in cache.find())
+    report['compact']['scan_resolved_seconds'] = time.perf_counter() - started
+
+    dimension_bytes = sum(
+        db.command('collStats', name).get('storageSize', 0)
+        for name in [c for c, _ in DIMENSION_COLLECTIONS.values()] + [TRANS_TYPE_COLLECTION]
+    )
+    report['compact']['dimension_storage_bytes'] = dimension_bytes
+
+    for layout, values in report.items():
+        logger.info(f"📏 {layout}: " + ", ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in values.items()))
+    return report
+
+# ===========================
+# PARALLEL EXECUTION
+# ===========================
+
+# Everything transform_sales_data joins except the sales tables themselves
+DIMENSION_KEYS = [
+    'products', 'product_categories', 'product_brands', 'product_ranges', 'products_styles',
+    'customer', 'customer_regions', 'representatives', 'trans_types'
+]
+
+# Set in each worker process by _init_worker
+_worker_dimensions = None
+_worker_collection = None
+
+def publish_dimensions(dfs):
+    """Write the dimension tables into one shared memory block as Arrow IPC streams."""
+    from multiprocessing import shared_memory
+    from arrow_frames import serialize_frame
+
+    payloads = {name: serialize_frame(dfs[name]) for name in DIMENSION_KEYS if name in dfs}
+    shm = shared_memory.SharedMemory(create=True, size=max(1, sum(len(p) for p in payloads.values())))
+
+    layout = {}
+    offset = 0
+    for name, payload in payloads.items():
+        shm.buf[offset:offset + len(payload)] = payload
+        layout[name] = (offset, len(payload))
+        offset += len(payload)
+
+    return shm, layout
+
+def _init_worker(shm_name, layout):
+    """Read the broadcast dimensions once per worker and open the worker's own MongoDB client."""
+    global _worker_dimensions, _worker_collection
+    from multiprocessing import shared_memory
+    from arrow_frames import deserialize_frame
+
+    logger.setLevel(logging.WARNING)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # Copy each payload out first: frames read zero-copy would keep views into shm.buf alive
+        # (e.g. categorical columns), and the segment could then not be closed
+        _worker_dimensions = {
+            name: deserialize_frame(bytes(shm.buf[offset:offset + size]))
+            for name, (offset, size) in layout.items()
+        }
+    finally:
+        shm.close()
+
+    _worker_collection = get_client(MONGO_URI)[DB_NAME][COLLECTION_NAME]
+
+def _process_shard(sales_header, sales_line):
+    """Transform one shard, build its documents and insert them; returns the inserted count."""
+    dfs = dict(_worker_dimensions, sales_header=sales_header, sales_line=sales_line)
+    merged = transform_sales_data(dfs)
+    if merged is None or len(merged) == 0:
+        return 0
+
+    docs = create_mongo_documents(merged)
+    if docs:
+        return write_batches(_worker_collection, docs, sink="sales_fact")
+    return 0
+
+def shard_sales(dfs, shard_count):
+    """Split sales header and line by DOC_NUMBER so that every document lands in exactly one shard."""
+    header_shard = pd.util.hash_pandas_object(dfs['sales_header']['DOC_NUMBER'].astype(str), index=False) % shard_count
+    line_shard = pd.util.hash_pandas_object(dfs['sales_line']['DOC_NUMBER'].astype(str), index=False) % shard_count
+
+    for shard in range(shard_count):
+        yield (
+            dfs['sales_header'][header_shard.values == shard],
+            dfs['sales_line'][line_shard.values == shard]
+        )
+
+@instrument("etl.run_parallel")
+def run_parallel(dfs, workers=None):
+    """
+    Transform, build and insert sales_fact documents across a process pool.
+    The dimensions are broadcast once through shared memory; sales are sharded by DOC_NUMBER.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    workers = workers or os.cpu_count() or 1
+    shard_count = workers * 4
+    logger.info(f"⚙️  Parallel mode: {workers} workers, {shard_count} shards")
+
+    shm, layout = publish_dimensions(dfs)
+    inserted = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shm.name, layout)) as pool:
+            futures = [pool.submit(_process_shard, header, line) for header, line in shard_sales(dfs, shard_count)]
+            for future in as_completed(futures):
+                inserted += future.result()
+    finally:
+        shm.close()
+        shm.unlink()
+
+    logger.info(f"✅ Inserted {inserted} documents into {DB_NAME}.{COLLECTION_NAME}")
+    collection = get_client(MONGO_URI)[DB_NAME][COLLECTION_NAME]
+    create_indexes(collection)
+    logger.info(f"🔍 Validation: {collection.count_documents({})} documents in database")
+    return inserted
+
 # ===========================
 # MAIN EXECUTION
 # ===========================
 
-def main():
+def log_stage_summary():
+    if metrics.enabled:
+        for entry in metrics.summary():
+            logger.info(f"⏱️  {entry['stage']}: {entry['wall_seconds']:.2f}s wall, {entry['cpu_seconds']:.2f}s cpu, "
+                        f"{entry['rows_in']} rows in, {entry['rows_out']} rows out")
+
+def main(workers=1, layout="nested"):
     logger.info("🚀 Starting ClearVue ETL Process...")
 
+    # Compact dimension keys are assigned centrally, so the parallel path only builds the nested layout
+    if workers != 1 and layout == "compact":
+        logger.error("❌ The compact layout is loaded serially; run it with --workers 1")
+        return
+
     # Step 1: Load Data
     dfs = load_data()
     if not dfs:
         logger.error("❌ No data loaded. Exiting.")
         return
 
+    # Steps 2-4 across a process pool
+    if workers != 1:
+        if 'sales_line' not in dfs or 'sales_header' not in dfs:
+            logger.error("❌ Required sales data missing!")
+            return
+        run_parallel(dfs, workers or None)
+        logger.info("🎉 ETL Process Completed Successfully!")
+        log_stage_summary()
+        return
+
     # Step 2: Transform Sales Data
     merged_df = transform_sales_data(dfs)
     if merged_df is None or len(merged_df) == 0:
         logger.error("❌ No sales data transformed. Exiting.")
         return
 
+    # Steps 3-4 in the compact layout (short dimension keys, dimensions in their own collections)
+    if layout == "compact":
+        load_compact_to_mongodb(merged_df)
+        logger.info("🎉 ETL Process Completed Successfully!")
+        log_stage_summary()
+        return
+
     # Step 3: Create MongoDB Documents
     mongo_docs = create_mongo_documents(merged_df)
     if not mongo_docs:
@@ -366,6 +779,30 @@ def main():
     load_to_mongodb(mongo_docs)
 
     logger.info("🎉 ETL Process Completed Successfully!")
+    log_stage_summary()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="ClearVue ETL Process")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes for transform/document building/loading (0 = all cores)")
+    parser.add_argument("--layout", choices=["nested", "compact"], default="nested",
+                        help="sales_fact document layout (compact stores dimension keys only)")
+    parser.add_argument("--compare-layouts", action="store_true",
+                        help="only report storage size and scan speed of both layouts")
+    parser.add_argument("--load-profile",
+                        help="bulk load profile for every sink, e.g. backfill or safe,batch_size=500 "
+                             "(see mongo_access.LOAD_PROFILES)")
+    args = parser.parse_args()
+    if args.workers != 1 and args.layout == "compact":
+        parser.error("--layout compact cannot be combined with --workers (the compact layout is loaded serially)")
+
+    # Through the environment so the parallel workers pick it up as well
+    if args.load_profile:
+        os.environ["CLEARVUE_LOAD_PROFILE"] = args.load_profile
+
+    if args.compare_layouts:
+        compare_layouts()
+    else:
+        main(args.workers, args.layout)
\ No newline at end of file
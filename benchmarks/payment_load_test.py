@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Load test for the payment streaming path (payment-transactions -> run_payment_consumer -> payment_stream).
+
+A producer thread publishes synthetic payments (the DEPOSIT_REF / DEPOSIT_DATE / CUSTOMER_NUMBER
+shape of synthetic_data.generate_payments) at a base rate with periodic bursts, e.g. to mimic
+month-end spikes. The consumer is run_payment_consumer itself (payment_stream load profile
+write concern, CustomerDimensionCache.start() with its refresh threads, process_payment), fed
+by an embedded in-process broker and writing to a mongomock or mongod database. Every sample interval the harness records throughput,
+p50/p99 end-to-end latency (publish -> stored) and consumer lag.
+
+Usage (from the repository root):
+    python benchmarks/payment_load_test.py --rate 200 --duration 60
+    python benchmarks/payment_load_test.py --rate 500 --burst-every 20 --burst-seconds 5 --burst-factor 8
+    python benchmarks/payment_load_test.py --backend mongod --mongo-uri mongodb://localhost:27017/
+
+The embedded broker has one partition and no network hop, so the numbers are an upper bound
+for the consumer itself; Kafka adds fetch latency on top.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from run_benchmarks import RESULTS_DIR, git_commit, make_client
+from synthetic_data import generate_dimensions, generate_payments, load_into_mongodb
+
+LOAD_DB = "clearvue_load_test"
+TOPIC = "payment-transactions"
+
+Message = namedtuple("Message", ["topic", "offset", "timestamp", "value"])
+
+
+def load_payment_consumer():
+    """Import real_time_payments/real_time_payments.py (not a package)"""
+    path = os.path.join(REPO_ROOT, "real_time_payments", "real_time_payments.py")
+    spec = importlib.util.spec_from_file_location("real_time_payments", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class EmbeddedBroker:
+    """In-process stand-in for one Kafka topic partition: append-only log, offsets, blocking reads"""
+
+    def __init__(self, topic=TOPIC):
+        self.topic = topic
+        self._log = []
+        self._cond = threading.Condition()
+        self.closed = False
+        # Consumer group offset, auto-committed as messages are handed out
+        self.committed = 0
+
+    def produce(self, value):
+        """Publish one JSON-serialized message; returns its offset"""
+        payload = json.dumps(value).encode("utf-8")
+        with self._cond:
+            offset = len(self._log)
+            self._log.append(Message(self.topic, offset, time.time(), payload))
+            self._cond.notify_all()
+        return offset
+
+    def end_offset(self):
+        return len(self._log)
+
+    def close(self):
+        """No more messages; consumers stop once they reach the end of the log"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def consumer(self):
+        return EmbeddedConsumer(self)
+
+
+class EmbeddedConsumer:
+    """
+    Iterates the broker log like KafkaConsumer with auto commit, deserializing values. A new consumer
+    resumes at the committed offset, so a restarted run_payment_consumer does not replay the log.
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def __iter__(self):
+        broker = self.broker
+        while True:
+            with broker._cond:
+                while broker.committed >= len(broker._log) and not broker.closed:
+                    broker._cond.wait(0.1)
+                if broker.committed >= len(broker._log):
+                    return
+                message = broker._log[broker.committed]
+                broker.committed += 1
+            yield message._replace(value=json.loads(message.value.decode("utf-8")))
+
+
+class RateProfile:
+    """Messages per second at time t: the base rate, times burst_factor during each burst window"""
+
+    def __init__(self, rate, burst_every=None, burst_seconds=0.0, burst_factor=1.0):
+        self.rate = rate
+        self.burst_every = burst_every
+        self.burst_seconds = burst_seconds
+        self.burst_factor = burst_factor
+
+    def rate_at(self, t):
+        if self.burst_every and (t % self.burst_every) >= self.burst_every - self.burst_seconds:
+            return self.rate * self.burst_factor
+        return self.rate
+
+
+class PaymentGenerator:
+    """Endless synthetic payments drawn from generate_payments, each with a unique DEPOSIT_REF"""
+
+    def __init__(self, dimensions, deposit_date=None, pool_scale=1, seed=44):
+        pool = generate_payments(dimensions, pool_scale, seed)['payment_lines']
+        self.customers = pool['CUSTOMER_NUMBER'].astype(str).to_numpy()
+        self.bank_amt = pool['BANK_AMT'].to_numpy()
+        self.discount = pool['DISCOUNT'].to_numpy()
+        self.deposit_date = deposit_date
+        self.sequence = 0
+
+    def next(self):
+        i = self.sequence % len(self.customers)
+        self.sequence += 1
+        deposit_date = self.deposit_date or datetime.now().strftime("%Y-%m-%d")
+        bank_amt = float(self.bank_amt[i])
+        discount = float(self.discount[i])
+        return {
+            'CUSTOMER_NUMBER': self.customers[i],
+            'DEPOSIT_REF': f"LT{self.sequence:010d}",
+            'DEPOSIT_DATE': deposit_date,
+            'FIN_PERIOD': int(deposit_date[:4] + deposit_date[5:7]),
+            'BANK_AMT': bank_amt,
+            'DISCOUNT': discount,
+            'TOT_PAYMENT': round(bank_amt + discount)
+        }
+
+
+def produce(broker, generator, profile, duration, tick=0.01):
+    """Publish at profile.rate_at(t) for `duration` seconds, then close the broker"""
+    started = time.perf_counter()
+    owed = 0.0
+    last = started
+    while True:
+        now = time.perf_counter()
+        elapsed = now - started
+        if elapsed >= duration:
+            break
+        owed += profile.rate_at(elapsed) * (now - last)
+        last = now
+        for _ in range(int(owed)):
+            broker.produce(generator.next())
+        owed -= int(owed)
+        time.sleep(tick)
+    broker.close()
+
+
+class ConsumerStats:
+    """Completed message count and latencies, shared between the consumer and the sampler"""
+
+    def __init__(self):
+        self.consumed = 0
+        self.latencies = []
+        self.consumer_starts = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        with self._lock:
+            self.consumed += 1
+            self.latencies.append(latency)
+
+    def snapshot(self):
+        with self._lock:
+            return self.consumed, len(self.latencies)
+
+
+def _percentiles(latencies):
+    if not latencies:
+        return None, None
+    p50, p99 = np.percentile(np.asarray(latencies) * 1000.0, [50, 99])
+    return float(p50), float(p99)
+
+
+def sample(broker, stats, started, interval, done):
+    """Timeline of throughput, latency percentiles and lag, one row per interval"""
+    timeline = []
+    last_consumed, last_latency_index = 0, 0
+    while not done.wait(interval):
+        consumed, latency_index = stats.snapshot()
+        produced = broker.end_offset()
+        p50, p99 = _percentiles(stats.latencies[last_latency_index:latency_index])
+        row = {
+            't': round(time.perf_counter() - started, 2),
+            'produced': produced,
+            'consumed': consumed,
+            'throughput': (consumed - last_consumed) / interval,
+            'p50_ms': p50,
+            'p99_ms': p99,
+            'lag': produced - consumed
+        }
+        timeline.append(row)
+        last_consumed, last_latency_index = consumed, latency_index
+        print(f"  t={row['t']:>7.1f}s  {row['throughput']:>8.0f} msg/s  lag {row['lag']:>7}  "
+              f"p50 {p50 or 0:>8.1f}ms  p99 {p99 or 0:>8.1f}ms")
+    return timeline
+
+
+def run_load_test(args):
+    client = make_client(args.backend, args.mongo_uri)
+    db = client[LOAD_DB]
+    dimensions = generate_dimensions(args.scale, seed=args.seed)
+    load_into_mongodb(dimensions, db)
+    db.payment_stream.drop()
+
+    payments = load_payment_consumer()
+    broker = EmbeddedBroker()
+    generator = PaymentGenerator(dimensions, args.deposit_date, seed=args.seed + 2)
+    profile = RateProfile(args.rate, args.burst_every, args.burst_seconds, args.burst_factor)
+    stats = ConsumerStats()
+    ready = threading.Event()
+    result = {}
+
+    def consumer_factory():
+        # Called once the customer cache is loaded, and again after every consumer error
+        stats.consumer_starts += 1
+        ready.set()
+        return broker.consumer()
+
+    def on_stored(message, payment):
+        stats.record(time.time() - message.timestamp)
+
+    def run_consumer():
+        result['customers'] = payments.run_payment_consumer(
+            consumer_factory=consumer_factory, db=db, on_stored=on_stored, log_messages=False
+        )
+
+    print(f"Load test: {args.rate} msg/s for {args.duration}s"
+          + (f", x{args.burst_factor} bursts of {args.burst_seconds}s every {args.burst_every}s" if args.burst_every else "")
+          + f" -> {args.backend}")
+
+    # Daemon, so a consumer that cannot catch up within --drain-timeout does not block the exit
+    consumer = threading.Thread(target=run_consumer, daemon=True)
+    consumer.start()
+    # Start producing once the consumer is up, so the cache load is not counted as latency
+    while not ready.wait(0.1):
+        if not consumer.is_alive():
+            raise RuntimeError("Payment consumer exited before it started consuming")
+
+    started = time.perf_counter()
+    done = threading.Event()
+    timeline = []
+    sampler = threading.Thread(target=lambda: timeline.extend(sample(broker, stats, started, args.sample_interval, done)))
+    producer = threading.Thread(target=produce, args=(broker, generator, profile, args.duration))
+
+    sampler.start()
+    producer.start()
+    producer.join()
+    consumer.join(args.drain_timeout)
+    drained = not consumer.is_alive()
+    finished = time.perf_counter() - started
+    done.set()
+    sampler.join()
+
+    p50, p99 = _percentiles(stats.latencies)
+    summary = {
+        'produced': broker.end_offset(),
+        'consumed': stats.consumed,
+        'consumer_restarts': stats.consumer_starts - 1,
+        'drained': drained,
+        'seconds': finished,
+        'sustained_throughput': stats.consumed / finished if finished else None,
+        'offered_rate': broker.end_offset() / args.duration,
+        'p50_ms': p50,
+        'p99_ms': p99,
+        'max_lag': max((row['lag'] for row in timeline), default=0),
+        'cache': result['customers'].stats() if 'customers' in result else None
+    }
+    if drained:
+        client.drop_database(LOAD_DB)
+    return summary, timeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the payment streaming path")
+    parser.add_argument("--rate", type=float, default=200, help="base messages per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of production")
+    parser.add_argument("--burst-every", type=float, help="seconds between bursts (no bursts by default)")
+    parser.add_argument("--burst-seconds", type=float, default=5, help="length of each burst")
+    parser.add_argument("--burst-factor", type=float, default=5, help="rate multiplier during a burst")
+    parser.add_argument("--deposit-date", help="YYYY-MM-DD for every payment (default: today), e.g. a month-end date")
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--drain-timeout", type=float, default=60, help="seconds to wait for the consumer to catch up")
+    parser.add_argument("--scale", type=int, default=1, help="customer dimension scale (see synthetic_data.py)")
+    parser.add_argument("--backend", choices=["mongomock", "mongod"], default="mongomock")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="result file (default: benchmarks/results/payments_<timestamp>_<commit>.json)")
+    args = parser.parse_args()
+
+    summary, timeline = run_load_test(args)
+
+    print(f"\nSustained throughput: {summary['sustained_throughput']:.0f} msg/s "
+          f"(offered {summary['offered_rate']:.0f} msg/s), {summary['consumed']}/{summary['produced']} consumed")
+    print(f"End-to-end latency: p50 {summary['p50_ms'] or 0:.1f}ms, p99 {summary['p99_ms'] or 0:.1f}ms; "
+          f"max lag {summary['max_lag']}" + ("" if summary['drained'] else " (consumer did NOT catch up)"))
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'backend': args.backend,
+        'settings': {key: value for key, value in vars(args).items() if key != 'output'},
+        'summary': summary,
+        'timeline': timeline
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"payments_{stamp}_{report['commit'] or 'nocommit'}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+ClearVue pipeline benchmarks.
+
+Runs extraction, joins, financial-period calculation, document building and Mongo load
+against synthetic data (see synthetic_data.py) and stores the timings as JSON so that
+runs can be compared.
+
+Usage (from the repository root):
+    python benchmarks/run_benchmarks.py --scale 10 100 --backend mongomock
+    python benchmarks/run_benchmarks.py --scale 10 --backend mongod --mongo-uri mongodb://localhost:27017/
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/a.json benchmarks/results/b.json
+
+Bulk load profiles (mongo_access.LOAD_PROFILES) are benchmarked as load.profile_<name>;
+write concern and concurrency only make a real difference with --backend mongod.
+
+Scale 1000 needs several tens of GB of RAM; run it on a dedicated machine against mongod.
+"""
+
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from importToBI3 import ClearVueBIProcessor
+from mongo_access import LOAD_PROFILES, bulk_load
+from pipeline_metrics import count_rows
+from synthetic_data import generate_dataset, load_into_mongodb
+
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+BENCH_DB = "clearvue_bench"
+
+
+def load_complete_etl():
+    """Import backlog scripts/complete_etl.py (the directory name is not importable)"""
+    path = os.path.join(REPO_ROOT, "backlog scripts", "complete_etl.py")
+    spec = importlib.util.spec_from_file_location("complete_etl", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.logger.setLevel(logging.WARNING)
+    return module
+
+
+def make_client(backend, mongo_uri):
+    if backend == "mongomock":
+        import mongomock
+        return mongomock.MongoClient()
+    from pymongo import MongoClient
+    return MongoClient(mongo_uri)
+
+
+def run_case(func, repeat, setup=None, memory=True):
+    """
+    Time func() `repeat` times; setup() runs untimed before each call and its result is passed in.
+    Peak memory comes from one extra, untimed run under tracemalloc, which slows code down several
+    times over and would skew the timings.
+    """
+    timings = []
+    rows = None
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        result = func(arg) if setup else func()
+        timings.append(time.perf_counter() - start)
+        rows = count_rows(result)
+
+    peak = None
+    if memory:
+        arg = setup() if setup else None
+        tracemalloc.start()
+        try:
+            func(arg) if setup else func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'repeat': repeat,
+        'min_seconds': min(timings),
+        'median_seconds': statistics.median(timings),
+        'mean_seconds': statistics.mean(timings),
+        'peak_memory_bytes': peak,
+        'rows_out': rows
+    }
+
+
+def benchmark_scale(scale, args, etl):
+    print(f"\n=== scale {scale}x ===", flush=True)
+    dataset = generate_dataset(scale, seed=args.seed)
+    print(f"sales_header={len(dataset['sales_header'])} sales_line={len(dataset['sales_line'])} "
+          f"payment_lines={len(dataset['payment_lines'])} customer={len(dataset['customer'])} "
+          f"products={len(dataset['products'])}")
+
+    client = make_client(args.backend, args.mongo_uri)
+    db = client[BENCH_DB]
+    load_into_mongodb(dataset, db)
+
+    processor = ClearVueBIProcessor(client=client, db_name=BENCH_DB)
+    results = {}
+
+    def record(name, func, setup=None):
+        result = run_case(func, args.repeat, setup, memory=not args.no_memory)
+        results[name] = result
+        print(f"  {name:<40} {result['median_seconds']:>10.4f}s  (rows out: {result['rows_out']})", flush=True)
+
+    # Extraction
+    record("extract.load_all_collections", processor.load_all_collections)
+    record("extract.sales_header_projected", lambda: processor.load_collection(
+        "sales header", ['DOC_NUMBER', 'CUSTOMER_NUMBER', 'TRANS_DATE']))
+    collections = processor.load_all_collections()
+
+    # Joins
+    record("join.bi_sales_fact", lambda: processor.create_sales_fact_table(collections))
+    record("join.bi_payment_fact", lambda: processor.create_payment_fact_table(collections))
+    record("join.bi_customer_dim", lambda: processor.create_customer_dimension(collections))
+    record("join.etl_transform_sales_data", lambda: etl.transform_sales_data(dataset))
+
+    # Financial period calculation
+    trans_dates = dataset['sales_header']['TRANS_DATE']
+    record("financial_period.bi_apply", lambda: trans_dates.apply(processor.calculate_financial_period))
+    record("financial_period.bi_vectorized", lambda: processor.calculate_financial_periods(trans_dates))
+    fin_periods = dataset['sales_header']['FIN_PERIOD']
+    record("financial_period.etl_fin_period_apply", lambda: fin_periods.apply(etl.fin_period_to_clearvue_fy))
+
+    # Document building
+    merged = etl.transform_sales_data(dataset)
+    record("documents.etl_create_mongo_documents", lambda: etl.create_mongo_documents(merged))
+
+    # Mongo load (fresh collection each run, building the documents is not timed)
+    docs = etl.create_mongo_documents(merged)
+    etl.MONGO_URI = args.mongo_uri
+    etl.DB_NAME = BENCH_DB
+    if args.backend == "mongomock":
+        etl.get_client = lambda uri=None: client
+
+    def fresh_docs():
+        db[etl.COLLECTION_NAME].drop()
+        return [dict(doc) for doc in docs]
+
+    record("load.etl_load_to_mongodb", lambda d: (etl.load_to_mongodb(d), d)[1], setup=fresh_docs)
+
+    # The same documents through each bulk load profile
+    for name, profile in LOAD_PROFILES.items():
+        record(f"load.profile_{name}", lambda d, p=profile: (bulk_load(db[etl.COLLECTION_NAME], d, p), d)[1],
+               setup=fresh_docs)
+        result = results[f"load.profile_{name}"]
+        result['profile'] = profile.as_dict()
+        result['docs_per_second'] = result['rows_out'] / result['median_seconds'] if result['median_seconds'] else None
+
+    client.drop_database(BENCH_DB)
+    return {
+        'scale': scale,
+        'rows': {key: len(df) for key, df in dataset.items()},
+        'benchmarks': results
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(baseline_path, candidate_path):
+    """Print median time ratios (candidate / baseline) for every benchmark both runs share"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+
+    base_runs = {run['scale']: run['benchmarks'] for run in baseline['runs']}
+    for run in candidate['runs']:
+        if run['scale'] not in base_runs:
+            continue
+        print(f"\n=== scale {run['scale']}x: {baseline.get('commit')} -> {candidate.get('commit')} ===")
+        for name, result in run['benchmarks'].items():
+            base = base_runs[run['scale']].get(name)
+            if base is None:
+                continue
+            ratio = result['median_seconds'] / base['median_seconds'] if base['median_seconds'] else float('nan')
+            flag = "  REGRESSION" if ratio > 1.1 else ("  faster" if ratio < 0.9 else "")
+            print(f"  {name:<40} {base['median_seconds']:>9.4f}s -> {result['median_seconds']:>9.4f}s  x{ratio:.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ClearVue pipeline benchmarks")
+    parser.add_argument("--scale", type=int, nargs="+", default=[10], help="data scale factors, e.g. 10 100 1000")
+    parser.add_argument("--backend", choices=["mongomock", "mongod"], default="mongomock")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="skip the extra tracemalloc pass per case (no peak memory)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<timestamp>_<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    etl = load_complete_etl()
+    runs = [benchmark_scale(scale, args, etl) for scale in args.scale]
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'backend': args.backend,
+        'seed': args.seed,
+        'environment': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'runs': runs
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}_{report['commit'] or 'nocommit'}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# Synthetic ClearVue data generator
+# Produces schema-faithful DataFrames (same collection keys and column names as the
+# exceldata workbooks, transform_sales_data and create_sales_fact_table) at any scale.
+#
+# Scale 1 matches the row counts of the exceldata workbooks. Fact tables (sales, payments,
+# age analysis) grow linearly with the scale; customers and products grow with its square
+# root, which keeps the fact/dimension ratio realistic as history accumulates.
+
+import math
+import numpy as np
+import pandas as pd
+
+BASE_ROWS = {
+    'sales_header': 67988,
+    'lines_per_doc': 2.5,
+    'customer': 2920,
+    'products': 7992,
+    'payment_lines': 2646,
+    'purchases_headers': 71,
+    'purchases_lines': 3077,
+}
+
+START_DATE = pd.Timestamp('2018-01-01')
+END_DATE = pd.Timestamp('2025-12-31')
+
+TRANS_TYPES = {1: 'TAX INVOICE', 2: 'CREDIT NOTE', 3: 'DEBIT NOTE', 4: 'JOURNAL', 5: 'RETURN'}
+PRODUCT_RANGES = {1: 'Product', 2: 'Parts', 3: 'Accessories'}
+GENDERS = ['female', 'male', 'unisex']
+MATERIALS = ['plastic', 'metal', 'titanium', 'acetate']
+STYLES = ['classic', 'sport', 'fashion', 'rimless']
+PARAMETERS = ['Open', 'Closed', 'Suspended']
+
+
+def _codes(prefix, count, width):
+    return np.array([f"{prefix}{i:0{width}d}" for i in range(count)], dtype=object)
+
+
+def _random_dates(rng, count):
+    days = (END_DATE - START_DATE).days
+    return START_DATE + pd.to_timedelta(rng.integers(0, days + 1, count), unit='D')
+
+
+def _fin_period(dates):
+    return (dates.year * 100 + dates.month).astype('int64')
+
+
+def generate_dimensions(scale=1, seed=42):
+    """Small dimension tables: categories, brands, ranges, styles, regions, reps, trans types, customers"""
+    rng = np.random.default_rng(seed)
+    dim_scale = math.sqrt(scale)
+
+    product_brands = pd.DataFrame({
+        'PRODBRA_CODE': np.arange(1, 10),
+        'PRODBRA_DESC': [chr(ord('A') + i) for i in range(9)]
+    })
+    product_ranges = pd.DataFrame({
+        'PRAN_CODE': list(PRODUCT_RANGES.keys()),
+        'PRAN_DESC': list(PRODUCT_RANGES.values())
+    })
+    product_categories = pd.DataFrame({
+        'PRODCAT_CODE': _codes('', 60, 3),
+        'PRODCAT_DESC': [f"Category {i}" for i in range(60)],
+        'BRAND_CODE': rng.integers(1, 10, 60),
+        'PRAN_CODE': rng.integers(1, len(PRODUCT_RANGES) + 1, 60)
+    })
+
+    product_count = int(BASE_ROWS['products'] * dim_scale)
+    products = pd.DataFrame({
+        'INVENTORY_CODE': _codes('INV', product_count, 7),
+        'PRODCAT_CODE': product_categories['PRODCAT_CODE'].to_numpy()[rng.integers(0, 60, product_count)],
+        'LAST_COST': rng.integers(5, 2500, product_count).astype('float64'),
+        'STOCK_IND': rng.choice(['Yes', 'No'], product_count)
+    })
+    products_styles = pd.DataFrame({
+        'INVENTORY_CODE': products['INVENTORY_CODE'],
+        'GENDER': rng.choice(GENDERS, product_count),
+        'MATERIAL': rng.choice(MATERIALS, product_count),
+        'STYLE': rng.choice(STYLES, product_count),
+        'COLOUR': 'N/A',
+        'BRANDING': 'N/A',
+        'QUAL_PROBS': 'N/A'
+    })
+
+    customer_regions = pd.DataFrame({
+        'REGION_CODE': [f"{i}{chr(ord('a') + i % 3)}" for i in range(34)],
+        'REGION_DESC': [f"Region {i}" for i in range(34)]
+    })
+    customer_categories = pd.DataFrame({
+        'CCAT_CODE': _codes('', 51, 2),
+        'CCAT_DESC': [f"Customer Category {i}" for i in range(51)]
+    })
+    representatives = pd.DataFrame({
+        'REP_CODE': _codes('', 128, 2),
+        'REP_DESC': [f"REP {i}" for i in range(128)],
+        'COMM_METHOD': rng.choice(['Sales', 'Margin'], 128),
+        'COMMISSION': rng.integers(0, 10, 128)
+    })
+    trans_types = pd.DataFrame({
+        'TRANSTYPE_CODE': list(TRANS_TYPES.keys()),
+        'TRANSTYPE_DESC': list(TRANS_TYPES.values())
+    })
+
+    customer_count = int(BASE_ROWS['customer'] * dim_scale)
+    customer = pd.DataFrame({
+        'CUSTOMER_NUMBER': _codes('C', customer_count, 6),
+        'CCAT_CODE': customer_categories['CCAT_CODE'].to_numpy()[rng.integers(0, 51, customer_count)],
+        'REGION_CODE': customer_regions['REGION_CODE'].to_numpy()[rng.integers(0, 34, customer_count)],
+        'REP_CODE': representatives['REP_CODE'].to_numpy()[rng.integers(0, 128, customer_count)],
+        'SETTLE_TERMS': rng.choice([0, 30], customer_count),
+        'NORMAL_PAYTERMS': rng.choice([30, 60, 90], customer_count),
+        'DISCOUNT': rng.integers(0, 10, customer_count),
+        'CREDIT_LIMIT': rng.integers(0, 50, customer_count).astype('float64') * 1000
+    })
+    customer_account_parameters = pd.DataFrame({
+        'CUSTOMER_NUMBER': customer['CUSTOMER_NUMBER'],
+        'PARAMETER': rng.choice(PARAMETERS, customer_count)
+    })
+
+    suppliers = pd.DataFrame({
+        'SUPPLIER_CODE': _codes('', 22, 3),
+        'SUPPLIER_DESC': [f"Supplier {i}" for i in range(22)],
+        'EXCLSV': rng.choice(['Y', 'N'], 22),
+        'NORMAL_PAYTERMS': rng.choice([0, 30, 60], 22),
+        'CREDIT_LIMIT': rng.integers(0, 100, 22).astype('float64') * 1000
+    })
+
+    return {
+        'products': products,
+        'products_styles': products_styles,
+        'product_brands': product_brands,
+        'product_categories': product_categories,
+        'product_ranges': product_ranges,
+        'customer': customer,
+        'customer_categories': customer_categories,
+        'customer_regions': customer_regions,
+        'customer_account_parameters': customer_account_parameters,
+        'representatives': representatives,
+        'trans_types': trans_types,
+        'suppliers': suppliers
+    }
+
+
+def generate_sales(dimensions, scale=1, seed=43):
+    """Sales header and line tables referencing the given dimensions"""
+    rng = np.random.default_rng(seed)
+    customer = dimensions['customer']
+    products = dimensions['products']
+
+    doc_count = int(BASE_ROWS['sales_header'] * scale)
+    trans_date = _random_dates(rng, doc_count)
+    customer_idx = rng.integers(0, len(customer), doc_count)
+
+    sales_header = pd.DataFrame({
+        'DOC_NUMBER': _codes('DC', doc_count, 9),
+        'TRANSTYPE_CODE': rng.choice(list(TRANS_TYPES.keys()), doc_count, p=[0.8, 0.1, 0.04, 0.03, 0.03]),
+        'REP_CODE': customer['REP_CODE'].to_numpy()[customer_idx],
+        'CUSTOMER_NUMBER': customer['CUSTOMER_NUMBER'].to_numpy()[customer_idx],
+        'TRANS_DATE': trans_date,
+        'FIN_PERIOD': _fin_period(trans_date)
+    })
+
+    lines_per_doc = rng.poisson(BASE_ROWS['lines_per_doc'] - 1, doc_count) + 1
+    line_count = int(lines_per_doc.sum())
+    product_idx = rng.integers(0, len(products), line_count)
+    quantity = rng.integers(1, 20, line_count)
+    unit_price = np.round(products['LAST_COST'].to_numpy()[product_idx] * rng.uniform(1.1, 1.8, line_count), 2)
+
+    sales_line = pd.DataFrame({
+        'DOC_NUMBER': np.repeat(sales_header['DOC_NUMBER'].to_numpy(), lines_per_doc),
+        'INVENTORY_CODE': products['INVENTORY_CODE'].to_numpy()[product_idx],
+        'QUANTITY': quantity,
+        'UNIT_SELL_PRICE': unit_price,
+        'TOTAL_LINE_PRICE': np.round(quantity * unit_price, 2)
+    })
+
+    return {'sales_header': sales_header, 'sales_line': sales_line}
+
+
+def generate_payments(dimensions, scale=1, seed=44):
+    """Payment header and line tables (the shape the payment-transactions stream also carries)"""
+    rng = np.random.default_rng(seed)
+    customer = dimensions['customer']
+
+    payment_count = int(BASE_ROWS['payment_lines'] * scale)
+    deposit_date = _random_dates(rng, payment_count)
+    customer_number = customer['CUSTOMER_NUMBER'].to_numpy()[rng.integers(0, len(customer), payment_count)]
+    bank_amt = -np.round(rng.gamma(2.0, 2500.0, payment_count), 2)
+    discount = np.where(rng.random(payment_count) < 0.1, np.round(bank_amt * 0.02, 2), 0.0)
+
+    payment_lines = pd.DataFrame({
+        'CUSTOMER_NUMBER': customer_number,
+        'FIN_PERIOD': _fin_period(deposit_date),
+        'DEPOSIT_DATE': deposit_date,
+        'DEPOSIT_REF': _codes('DB', payment_count, 9),
+        'BANK_AMT': bank_amt,
+        'DISCOUNT': discount,
+        'TOT_PAYMENT': np.round(bank_amt + discount, 0)
+    })
+    payment_header = payment_lines[['CUSTOMER_NUMBER', 'DEPOSIT_REF']].copy()
+
+    return {'payment_lines': payment_lines, 'payment_header': payment_header}
+
+
+def generate_purchases(dimensions, scale=1, seed=45):
+    rng = np.random.default_rng(seed)
+    products = dimensions['products']
+    suppliers = dimensions['suppliers']
+
+    header_count = max(1, int(BASE_ROWS['purchases_headers'] * scale))
+    purch_date = _random_dates(rng, header_count)
+    purchases_headers = pd.DataFrame({
+        'SUPPLIER_CODE': suppliers['SUPPLIER_CODE'].to_numpy()[rng.integers(0, len(suppliers), header_count)],
+        'PURCH_DOC_NO': _codes('PC', header_count, 9),
+        'PURCH_DATE': purch_date
+    })
+
+    line_count = int(BASE_ROWS['purchases_lines'] * scale)
+    quantity = rng.integers(1, 50, line_count)
+    unit_cost = np.round(products['LAST_COST'].to_numpy()[rng.integers(0, len(products), line_count)], 2)
+    purchases_lines = pd.DataFrame({
+        'PURCH_DOC_NO': purchases_headers['PURCH_DOC_NO'].to_numpy()[rng.integers(0, header_count, line_count)],
+        'INVENTORY_CODE': products['INVENTORY_CODE'].to_numpy()[rng.integers(0, len(products), line_count)],
+        'QUANTITY': quantity,
+        'UNIT_COST_PRICE': unit_cost,
+        'TOTAL_LINE_COST': np.round(quantity * unit_cost, 2)
+    })
+
+    return {'purchases_headers': purchases_headers, 'purchases_lines': purchases_lines}
+
+
+def generate_age_analysis(dimensions, periods=24, seed=46):
+    """One aging snapshot per customer per FIN_PERIOD for the last `periods` months"""
+    rng = np.random.default_rng(seed)
+    customer_numbers = dimensions['customer']['CUSTOMER_NUMBER'].to_numpy()
+    fin_periods = _fin_period(pd.date_range(end=END_DATE, periods=periods, freq='MS'))
+
+    rows = len(customer_numbers) * len(fin_periods)
+    buckets = ['AMT_CURRENT'] + [f"AMT_{days}_DAYS" for days in range(30, 361, 30)]
+    amounts = np.where(rng.random((rows, len(buckets))) < 0.3, np.round(rng.gamma(1.5, 800.0, (rows, len(buckets))), 0), 0.0)
+
+    age_analysis = pd.DataFrame(amounts, columns=buckets)
+    age_analysis.insert(0, 'CUSTOMER_NUMBER', np.repeat(customer_numbers, len(fin_periods)))
+    age_analysis.insert(1, 'FIN_PERIOD', np.tile(fin_periods, len(customer_numbers)))
+    age_analysis.insert(2, 'TOTAL_DUE', amounts.sum(axis=1))
+    return age_analysis
+
+
+def generate_dataset(scale=1, seed=42):
+    """All ClearVue source tables, keyed like ClearVueBIProcessor.load_all_collections()"""
+    dimensions = generate_dimensions(scale, seed)
+
+    dataset = dict(dimensions)
+    dataset.update(generate_sales(dimensions, scale, seed + 1))
+    dataset.update(generate_payments(dimensions, scale, seed + 2))
+    dataset.update(generate_purchases(dimensions, scale, seed + 3))
+    dataset['age_analysis'] = generate_age_analysis(dimensions, seed=seed + 4)
+    return dataset
+
+
+def load_into_mongodb(dataset, db, batch_size=50000):
+    """Write a generated dataset into the collection names used by the Excel import"""
+    from importToBI3 import ClearVueBIProcessor
+
+    for key, collection_name in ClearVueBIProcessor.COLLECTIONS.items():
+        if key not in dataset:
+            continue
+        collection = db[collection_name]
+        collection.drop()
+        df = dataset[key]
+        for start in range(0, len(df), batch_size):
+            collection.insert_many(df.iloc[start:start + batch_size].to_dict(orient="records"))
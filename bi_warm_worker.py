@@ -0,0 +1,134 @@
+# ClearVue BI warm worker
+# Long-running local process that keeps the MongoDB connection pool, the financial calendar
+# and the built Power BI datasets in memory. The Power BI thin client (importToBI3_thin.py)
+# only fetches the ready frames as Arrow IPC streams over a local socket, so a refresh costs
+# transfer time instead of a fresh interpreter + full pipeline build.
+#
+# Run this as a separate service, NOT in Power BI:
+#     python bi_warm_worker.py
+#
+# Protocol: the client sends one JSON line {"datasets": [...] | null, "refresh": bool}.
+# The worker answers with one JSON header line {"ok": true, "built_at": ..., "datasets":
+# [{"name": ..., "bytes": ...}, ...]} followed by each dataset's Arrow IPC stream, in order.
+
+import json
+import os
+import socketserver
+import threading
+import time
+
+from arrow_frames import serialize_frame
+from importToBI3 import ClearVueBIProcessor
+from pipeline_metrics import stage
+
+WORKER_HOST = os.environ.get("CLEARVUE_BI_WORKER_HOST", "127.0.0.1")
+WORKER_PORT = int(os.environ.get("CLEARVUE_BI_WORKER_PORT", "8765"))
+REFRESH_INTERVAL = int(os.environ.get("CLEARVUE_BI_REFRESH_SECONDS", "300"))
+# Background refreshes append new purchases; every Nth one rebuilds purchases_fact in full
+FULL_REFRESH_EVERY = int(os.environ.get("CLEARVUE_BI_FULL_REFRESH_EVERY", "12"))
+
+
+class BIWarmWorker:
+    """Builds the Power BI datasets with one long-lived processor and caches them as Arrow payloads"""
+
+    def __init__(self, processor=None, refresh_interval=REFRESH_INTERVAL, full_refresh_every=FULL_REFRESH_EVERY):
+        self.processor = processor or ClearVueBIProcessor()
+        self.refresh_interval = refresh_interval
+        self.full_refresh_every = full_refresh_every
+        self.refreshes = 0
+        self._purchases_fact = None
+        self.payloads = {}
+        self.built_at = None
+        self.last_error = None
+        self._build_lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def refresh(self, full=False):
+        """
+        Rebuild every dataset. The previous payloads keep being served until the new ones are ready.
+        purchases_fact is appended to incrementally unless full=True or a periodic full rebuild is due.
+        """
+        with self._build_lock:
+            full = full or self._purchases_fact is None or self.refreshes % self.full_refresh_every == 0
+            with stage("worker.build_datasets"):
+                datasets = self.processor.generate_power_bi_datasets(
+                    purchases_fact=None if full else self._purchases_fact
+                )
+            self._purchases_fact = datasets['purchases_fact']
+            self.refreshes += 1
+
+            with stage("worker.serialize_datasets", rows_in=sum(len(df) for df in datasets.values())):
+                payloads = {name: serialize_frame(df) for name, df in datasets.items()}
+
+            self.payloads = payloads
+            self.built_at = time.time()
+            self.last_error = None
+            self._ready.set()
+            print(f"Datasets refreshed: {', '.join(f'{n}={len(df)}' for n, df in datasets.items())}")
+
+    def refresh_forever(self):
+        """Background loop keeping the cache warm so Power BI never waits on a build"""
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error refreshing datasets: {e}")
+            time.sleep(self.refresh_interval)
+
+    def get_payloads(self, names=None, refresh=False, timeout=None):
+        if refresh:
+            self.refresh(full=True)
+        if not self._ready.wait(timeout):
+            raise RuntimeError(self.last_error or "Datasets are still being built")
+
+        payloads = self.payloads
+        names = names or list(payloads.keys())
+        missing = [name for name in names if name not in payloads]
+        if missing:
+            raise KeyError(f"Unknown datasets: {missing}")
+        return [(name, payloads[name]) for name in names]
+
+
+class _WorkerRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline() or b"{}")
+            with stage("worker.serve_request"):
+                payloads = self.server.worker.get_payloads(
+                    request.get("datasets"), bool(request.get("refresh")), timeout=request.get("timeout")
+                )
+        except Exception as e:
+            self.wfile.write((json.dumps({"ok": False, "error": str(e)}) + "\n").encode("utf-8"))
+            return
+
+        header = {
+            "ok": True,
+            "built_at": self.server.worker.built_at,
+            "datasets": [{"name": name, "bytes": len(payload)} for name, payload in payloads]
+        }
+        self.wfile.write((json.dumps(header) + "\n").encode("utf-8"))
+        for _, payload in payloads:
+            self.wfile.write(payload)
+
+
+class BIWorkerServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, worker, host=WORKER_HOST, port=WORKER_PORT):
+        self.worker = worker
+        super().__init__((host, port), _WorkerRequestHandler)
+
+
+def run_worker(host=WORKER_HOST, port=WORKER_PORT, refresh_interval=REFRESH_INTERVAL):
+    worker = BIWarmWorker(refresh_interval=refresh_interval)
+    threading.Thread(target=worker.refresh_forever, daemon=True).start()
+
+    with BIWorkerServer(worker, host, port) as server:
+        print(f"BI warm worker listening on {host}:{port} (refresh every {refresh_interval}s)")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    run_worker()
@@ -0,0 +1,189 @@
+# In-process customer dimension cache for the payment stream consumer
+# Enriches each payment with the customer's region, category, rep and credit limit from
+# `customer`, `customer regions`, `customer categories` and `representatives`, so the
+# dashboards do not have to join payment_stream back to those collections and the consumer
+# does no database round trip per message.
+#
+# The four tables are loaded in full (customer projected to CUSTOMER_COLUMNS as compact tuples),
+# so enrichment never queries the database. Built per-customer attribute dicts are kept in an
+# LRU bounded by CLEARVUE_CUSTOMER_CACHE_SIZE.
+#
+# The tables are reloaded in a background thread every CLEARVUE_CUSTOMER_CACHE_TTL seconds,
+# or as soon as a change stream reports a write to one of them (replica sets only; elsewhere
+# the TTL alone applies). A reload builds new tables and rebuilds the cached entries from them,
+# then swaps everything in at once, so lookups never see an empty cache.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from importToBI3 import ClearVueBIProcessor
+from source_schema import normalize_code
+
+CACHE_TTL_SECONDS = int(os.environ.get("CLEARVUE_CUSTOMER_CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.environ.get("CLEARVUE_CUSTOMER_CACHE_SIZE", "50000"))
+# Change stream reconnects back off from WATCH_RETRY_SECONDS up to the TTL
+WATCH_RETRY_SECONDS = 5
+
+CUSTOMER_COLUMNS = ['CUSTOMER_NUMBER', 'CCAT_CODE', 'REGION_CODE', 'REP_CODE', 'CREDIT_LIMIT']
+SOURCE_KEYS = ['customer', 'customer_regions', 'customer_categories', 'representatives']
+
+# Added to every payment; None when the customer or the code is unknown
+ENRICHED_FIELDS = ['REGION_CODE', 'REGION_DESC', 'CCAT_CODE', 'CCAT_DESC', 'REP_CODE', 'REP_DESC', 'CREDIT_LIMIT']
+
+
+def _lookup(frame, key, value):
+    """{code: desc} for a small code table"""
+    frame = frame.dropna(subset=[key]).drop_duplicates(key)
+    return {normalize_code(code): desc for code, desc in zip(frame[key], frame[value])}
+
+
+def _value(value):
+    return None if value is None or value != value else value
+
+
+class CustomerDimensionCache:
+    def __init__(self, processor=None, ttl_seconds=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.processor = processor or ClearVueBIProcessor()
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self.customers = {}
+        self.regions = {}
+        self.categories = {}
+        self.reps = {}
+        self.loaded_at = None
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stale = threading.Event()
+        self.hits = self.misses = self.reloads = 0
+
+    # --- loading ---
+
+    def load(self):
+        """(Re)load the four source collections and swap them in together with the rebuilt entries"""
+        p = self.processor
+        customer = p.load_collection(p.COLLECTIONS['customer'], CUSTOMER_COLUMNS)
+        regions = p.load_collection(p.COLLECTIONS['customer_regions'], ['REGION_CODE', 'REGION_DESC'])
+        categories = p.load_collection(p.COLLECTIONS['customer_categories'], ['CCAT_CODE', 'CCAT_DESC'])
+        reps = p.load_collection(p.COLLECTIONS['representatives'], ['REP_CODE', 'REP_DESC'])
+
+        # Raw customer rows as tuples: compact, and an LRU miss is a dict lookup, never a query
+        customer = customer.dropna(subset=['CUSTOMER_NUMBER']).drop_duplicates('CUSTOMER_NUMBER')
+        tables = {
+            'customers': {
+                normalize_code(row[0]): row[1:]
+                for row in customer[CUSTOMER_COLUMNS].itertuples(index=False, name=None)
+            },
+            'regions': _lookup(regions, 'REGION_CODE', 'REGION_DESC'),
+            'categories': _lookup(categories, 'CCAT_CODE', 'CCAT_DESC'),
+            'reps': _lookup(reps, 'REP_CODE', 'REP_DESC')
+        }
+
+        with self._lock:
+            # Same keys and recency order, built from the new tables
+            entries = OrderedDict((key, self._build(key, tables)) for key in self._entries)
+            self.customers = tables['customers']
+            self.regions = tables['regions']
+            self.categories = tables['categories']
+            self.reps = tables['reps']
+            self._entries = entries
+            self.loaded_at = time.time()
+            self.reloads += 1
+        self._stale.clear()
+        print(f"Customer cache loaded: {len(self.customers)} customers")
+
+    def invalidate(self):
+        """Ask the refresh thread to reload now"""
+        self._stale.set()
+
+    def _refresh_forever(self):
+        while True:
+            self._stale.wait(self.ttl_seconds)
+            try:
+                self.load()
+            except Exception as e:
+                # Keep serving the previous tables until the next attempt
+                print(f"Error refreshing customer cache: {e}")
+
+    def _watch_changes(self):
+        """Invalidate on any write to the source collections (needs a replica set); reconnects with backoff"""
+        names = [self.processor.COLLECTIONS[key] for key in SOURCE_KEYS]
+        delay = WATCH_RETRY_SECONDS
+        while True:
+            try:
+                with self.processor.db.watch([{'$match': {'ns.coll': {'$in': names}}}]) as stream:
+                    delay = WATCH_RETRY_SECONDS
+                    for _ in stream:
+                        self.invalidate()
+            except Exception as e:
+                # Standalone servers raise OperationFailure, mongomock NotImplementedError, etc.
+                print(f"Customer cache change stream unavailable ({e!r}); retrying in {delay}s, "
+                      f"refreshing every {self.ttl_seconds}s meanwhile")
+            time.sleep(delay)
+            delay = min(delay * 2, max(self.ttl_seconds, WATCH_RETRY_SECONDS))
+
+    def start(self, watch_changes=True):
+        """Load synchronously, then keep the cache fresh in background threads"""
+        self.load()
+        threading.Thread(target=self._refresh_forever, daemon=True).start()
+        if watch_changes:
+            threading.Thread(target=self._watch_changes, daemon=True).start()
+        return self
+
+    # --- lookups ---
+
+    def _build(self, customer_number, tables=None):
+        tables = tables or {'customers': self.customers, 'regions': self.regions,
+                            'categories': self.categories, 'reps': self.reps}
+        row = tables['customers'].get(customer_number)
+        if row is None:
+            return None
+        ccat_code, region_code, rep_code = (normalize_code(value) for value in row[:3])
+        credit_limit = row[3]
+        return {
+            'REGION_CODE': region_code,
+            'REGION_DESC': tables['regions'].get(region_code),
+            'CCAT_CODE': ccat_code,
+            'CCAT_DESC': tables['categories'].get(ccat_code),
+            'REP_CODE': rep_code,
+            'REP_DESC': tables['reps'].get(rep_code),
+            'CREDIT_LIMIT': _value(credit_limit)
+        }
+
+    def lookup(self, customer_number):
+        """The customer's attributes, or None for an unknown customer"""
+        customer_number = normalize_code(customer_number)
+        with self._lock:
+            if customer_number in self._entries:
+                self._entries.move_to_end(customer_number)
+                self.hits += 1
+                return self._entries[customer_number]
+
+            self.misses += 1
+            entry = self._build(customer_number)
+            # Unknown customers are cached too; the next reload rebuilds them
+            self._entries[customer_number] = entry
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entry
+
+    def enrich(self, payment):
+        """Add the customer attributes (ENRICHED_FIELDS) to a payment message in place"""
+        entry = self.lookup(payment.get('CUSTOMER_NUMBER')) or {}
+        for field in ENRICHED_FIELDS:
+            payment[field] = entry.get(field)
+        payment['CUSTOMER_KNOWN'] = bool(entry)
+        return payment
+
+    def stats(self):
+        return {
+            'customers': len(self.customers),
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'reloads': self.reloads,
+            'loaded_at': self.loaded_at
+        }
@@ -0,0 +1,309 @@
+# Customer 360 materialization
+# One pre-aggregated document per customer in `customer_summary`, so a Power BI drill-through
+# is a single indexed read instead of filtering the full sales_fact / payment_fact frames.
+#
+# Each document holds the customer dimension attributes, sales and payment totals per
+# financial period (Excel payment lines plus streamed payments), rolling 12-period totals,
+# the latest age analysis and credit limit usage.
+# Incremental runs only recompute customers with sales, payments, age analysis or customer /
+# account parameter rows *loaded* since the last run. The watermark is the ObjectId `_id` per
+# source collection, i.e. load time, so backdated rows and Excel backfills are picked up as well.
+# The rolling totals end at the current financial period, so every customer is rebuilt once
+# that period changes.
+#
+#     python customer_summary.py            # incremental
+#     python customer_summary.py --full     # rebuild every customer
+
+import argparse
+from datetime import datetime, timedelta
+
+import pandas as pd
+from bson import ObjectId
+from pymongo import ReplaceOne
+
+from importToBI3 import ClearVueBIProcessor
+from pipeline_metrics import instrument
+
+SUMMARY_COLLECTION = "customer_summary"
+STATE_COLLECTION = "customer_summary_state"
+STREAM_COLLECTION = "payment_stream"
+ROLLING_PERIODS = 12
+CUSTOMER_BATCH = 5000
+DOC_NUMBER_BATCH = 20000
+
+# Collections whose new documents mark customers as changed
+WATERMARK_KEYS = ['sales_header', 'sales_line', 'payment_lines', 'age_analysis',
+                  'customer', 'customer_account_parameters']
+# Of those, the ones keyed by CUSTOMER_NUMBER (sales lines are mapped through their header)
+CUSTOMER_KEYED = ['sales_header', 'payment_lines', 'age_analysis', 'customer', 'customer_account_parameters']
+# ObjectIds are generated by the inserting client, so concurrent loaders can commit slightly
+# out of order; the stored watermark is stepped back by this much (re-processing is idempotent)
+WATERMARK_MARGIN = timedelta(minutes=5)
+
+
+def _key_variants(values):
+    """Customer numbers may be stored as int in one collection and str in another; match both"""
+    variants = set()
+    for value in values:
+        variants.add(str(value))
+        if str(value).isdigit():
+            variants.add(int(value))
+    return list(variants)
+
+
+def _none_if_nan(value):
+    """NaN -> None and numpy scalars -> Python values, so the value can be stored in BSON"""
+    if value is None or pd.isna(value):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+
+class CustomerSummaryBuilder:
+    def __init__(self, processor=None):
+        self.processor = processor or ClearVueBIProcessor()
+        self.db = self.processor.db
+        self.collection = self.db[SUMMARY_COLLECTION]
+        self.state = self.db[STATE_COLLECTION]
+
+    def ensure_indexes(self):
+        self.collection.create_index([("CUSTOMER_NUMBER", 1)], unique=True)
+
+    # --- source extraction ---
+
+    def watermark_collections(self):
+        names = [self.processor.COLLECTIONS[key] for key in WATERMARK_KEYS]
+        return names + [STREAM_COLLECTION]
+
+    def current_watermarks(self):
+        """Per source collection: an ObjectId just below the newest document's _id (None if empty)"""
+        watermarks = {}
+        for name in self.watermark_collections():
+            newest = self.db[name].find_one({}, {'_id': 1}, sort=[('_id', -1)])
+            if newest is not None and isinstance(newest['_id'], ObjectId):
+                watermarks[name] = ObjectId.from_datetime(newest['_id'].generation_time - WATERMARK_MARGIN)
+            else:
+                watermarks[name] = None
+        return watermarks
+
+    def changed_customers(self, watermarks):
+        """Customers with any source row loaded after the per-collection watermarks"""
+        p = self.processor
+
+        def loaded_after(name):
+            since = watermarks.get(name)
+            return {'_id': {'$gt': since}} if since is not None else {}
+
+        names = [p.COLLECTIONS[key] for key in CUSTOMER_KEYED] + [STREAM_COLLECTION]
+        frames = [p.load_collection(name, ['CUSTOMER_NUMBER'], loaded_after(name)) for name in names]
+
+        # A late sales line changes the totals of its header's customer
+        lines = p.load_collection(p.COLLECTIONS['sales_line'], ['DOC_NUMBER'], loaded_after(p.COLLECTIONS['sales_line']))
+        doc_numbers = lines['DOC_NUMBER'].dropna().unique().tolist()
+        for start in range(0, len(doc_numbers), DOC_NUMBER_BATCH):
+            frames.append(p.load_collection(
+                p.COLLECTIONS['sales_header'], ['CUSTOMER_NUMBER'],
+                {'DOC_NUMBER': {'$in': doc_numbers[start:start + DOC_NUMBER_BATCH]}}
+            ))
+
+        customers = pd.concat([df['CUSTOMER_NUMBER'] for df in frames]).dropna().astype(str)
+        return sorted(customers.unique())
+
+    def load_sales(self, customer_query):
+        p = self.processor
+        headers = p.load_collection(
+            p.COLLECTIONS['sales_header'], ['DOC_NUMBER', 'CUSTOMER_NUMBER', 'TRANS_DATE'], customer_query
+        )
+        if headers.empty:
+            return pd.DataFrame(columns=['CUSTOMER_NUMBER', 'TRANS_DATE', 'TOTAL_LINE_PRICE'])
+
+        line_query = None
+        if customer_query is not None:
+            line_query = {'DOC_NUMBER': {'$in': headers['DOC_NUMBER'].dropna().unique().tolist()}}
+        lines = p.load_collection(p.COLLECTIONS['sales_line'], ['DOC_NUMBER', 'TOTAL_LINE_PRICE'], line_query)
+
+        return pd.merge(headers, lines, on="DOC_NUMBER", how="inner")
+
+    def load_payments(self, customer_query):
+        """Payment lines plus streamed payments that are not (yet) in the payment lines"""
+        p = self.processor
+        columns = ['CUSTOMER_NUMBER', 'DEPOSIT_REF', 'DEPOSIT_DATE', 'TOT_PAYMENT']
+        lines = p.load_collection(p.COLLECTIONS['payment_lines'], columns, customer_query)
+        stream = p.load_collection(STREAM_COLLECTION, columns, customer_query)
+        if stream.empty:
+            return lines
+
+        def keys(df):
+            return df['CUSTOMER_NUMBER'].astype(str) + '|' + df['DEPOSIT_REF'].astype(str)
+
+        stream = stream[~keys(stream).isin(keys(lines))]
+        stream = stream.assign(DEPOSIT_DATE=pd.to_datetime(stream['DEPOSIT_DATE'], errors='coerce'))
+        return pd.concat([lines, stream], ignore_index=True)
+
+    def load_latest_aging(self, customer_query):
+        p = self.processor
+        age_analysis = p.load_collection(p.COLLECTIONS['age_analysis'], p.AGE_ANALYSIS_COLUMNS, customer_query)
+        if age_analysis.empty:
+            return age_analysis
+        age_analysis = p.normalize_age_analysis(age_analysis)
+        latest = age_analysis.groupby('CUSTOMER_NUMBER')['FIN_PERIOD'].idxmax()
+        return age_analysis.loc[latest].set_index('CUSTOMER_NUMBER')
+
+    def load_customers(self, customer_query):
+        p = self.processor
+        collections = {
+            'customer': p.load_collection(p.COLLECTIONS['customer'], query=customer_query),
+            'customer_categories': p.load_collection(p.COLLECTIONS['customer_categories']),
+            'customer_regions': p.load_collection(p.COLLECTIONS['customer_regions']),
+            'customer_account_parameters': p.load_collection(p.COLLECTIONS['customer_account_parameters'], query=customer_query)
+        }
+        customer_dim = p.create_customer_dimension(collections)
+        customer_dim['CUSTOMER_NUMBER'] = customer_dim['CUSTOMER_NUMBER'].astype(str)
+        return customer_dim.drop_duplicates('CUSTOMER_NUMBER').set_index('CUSTOMER_NUMBER')
+
+    # --- aggregation ---
+
+    def period_totals(self, sales, payments):
+        """Sales and payment totals per customer per financial period (vectorized groupbys)"""
+        p = self.processor
+
+        sales = sales.assign(
+            CUSTOMER_NUMBER=sales['CUSTOMER_NUMBER'].astype(str),
+            FINANCIAL_PERIOD=p.calculate_financial_periods(sales['TRANS_DATE']),
+            TOTAL_LINE_PRICE=pd.to_numeric(sales['TOTAL_LINE_PRICE'], errors='coerce').fillna(0.0)
+        )
+        sales_totals = sales.groupby(['CUSTOMER_NUMBER', 'FINANCIAL_PERIOD']).agg(
+            sales_total=('TOTAL_LINE_PRICE', 'sum'), sales_lines=('TOTAL_LINE_PRICE', 'size')
+        )
+
+        payments = payments.assign(
+            CUSTOMER_NUMBER=payments['CUSTOMER_NUMBER'].astype(str),
+            FINANCIAL_PERIOD=p.calculate_financial_periods(payments['DEPOSIT_DATE']),
+            TOT_PAYMENT=pd.to_numeric(payments['TOT_PAYMENT'], errors='coerce').fillna(0.0)
+        )
+        payment_totals = payments.groupby(['CUSTOMER_NUMBER', 'FINANCIAL_PERIOD']).agg(
+            payments_total=('TOT_PAYMENT', 'sum'), payments_count=('TOT_PAYMENT', 'size')
+        )
+
+        totals = sales_totals.join(payment_totals, how='outer').fillna(0).reset_index()
+        totals[['sales_lines', 'payments_count']] = totals[['sales_lines', 'payments_count']].astype('int64')
+        return totals.sort_values(['CUSTOMER_NUMBER', 'FINANCIAL_PERIOD'])
+
+    def build_documents(self, customer_dim, totals, latest_aging):
+        now = datetime.now()
+        # Rolling window ends at the current financial period, the same for every customer
+        current_period = self.processor.calculate_financial_period(pd.Timestamp(now))
+        rolling_start = (pd.Period(current_period, freq='M') - (ROLLING_PERIODS - 1)).strftime('%Y-%m')
+
+        periods_by_customer = {customer: group for customer, group in totals.groupby('CUSTOMER_NUMBER', sort=False)}
+        customers = customer_dim.index.union(pd.Index(list(periods_by_customer.keys())))
+
+        docs = []
+        for customer_number in customers:
+            attrs = customer_dim.loc[customer_number] if customer_number in customer_dim.index else pd.Series(dtype=object)
+            periods = periods_by_customer.get(customer_number, totals.iloc[0:0])
+            rolling = periods[periods['FINANCIAL_PERIOD'] >= rolling_start]
+
+            credit_limit = pd.to_numeric(pd.Series([attrs.get('CREDIT_LIMIT')]), errors='coerce').iloc[0]
+            credit_limit = None if pd.isna(credit_limit) else float(credit_limit)
+            aging = None
+            credit_limit_usage = None
+            if customer_number in latest_aging.index:
+                row = latest_aging.loc[customer_number]
+                aging = {'fin_period': int(row['FIN_PERIOD'])}
+                aging.update({col.lower(): float(row[col]) for col in ['TOTAL_DUE'] + self.processor.AGING_BUCKETS if col in row})
+                if credit_limit:
+                    credit_limit_usage = float(row['TOTAL_DUE']) / credit_limit
+
+            docs.append({
+                'CUSTOMER_NUMBER': customer_number,
+                'category': {'code': _none_if_nan(attrs.get('CCAT_CODE')), 'desc': _none_if_nan(attrs.get('CCAT_DESC'))},
+                'region': {'code': _none_if_nan(attrs.get('REGION_CODE')), 'desc': _none_if_nan(attrs.get('REGION_DESC'))},
+                'rep_code': _none_if_nan(attrs.get('REP_CODE')),
+                'account_parameter': _none_if_nan(attrs.get('PARAMETER')),
+                'credit_limit': credit_limit,
+                'periods': [
+                    {
+                        'financial_period': r.FINANCIAL_PERIOD,
+                        'sales_total': float(r.sales_total),
+                        'sales_lines': int(r.sales_lines),
+                        'payments_total': float(r.payments_total),
+                        'payments_count': int(r.payments_count)
+                    }
+                    for r in periods.itertuples(index=False)
+                ],
+                'totals': {
+                    'sales': float(periods['sales_total'].sum()),
+                    'payments': float(periods['payments_total'].sum()),
+                    'rolling_sales': float(rolling['sales_total'].sum()),
+                    'rolling_payments': float(rolling['payments_total'].sum()),
+                    'rolling_from_period': rolling_start
+                },
+                'aging': aging,
+                'credit_limit_usage': credit_limit_usage,
+                'updated_at': now
+            })
+        return docs
+
+    # --- materialization ---
+
+    @instrument("customer_summary.rebuild_customers")
+    def rebuild_customers(self, customer_numbers=None):
+        """Recompute and replace the summary of the given customers (all customers when None)"""
+        if customer_numbers is not None and len(customer_numbers) == 0:
+            return 0
+
+        batches = [None] if customer_numbers is None else [
+            customer_numbers[start:start + CUSTOMER_BATCH] for start in range(0, len(customer_numbers), CUSTOMER_BATCH)
+        ]
+
+        written = 0
+        for batch in batches:
+            query = None if batch is None else {'CUSTOMER_NUMBER': {'$in': _key_variants(batch)}}
+            totals = self.period_totals(self.load_sales(query), self.load_payments(query))
+            docs = self.build_documents(self.load_customers(query), totals, self.load_latest_aging(query))
+
+            if docs:
+                self.collection.bulk_write(
+                    [ReplaceOne({'CUSTOMER_NUMBER': doc['CUSTOMER_NUMBER']}, doc, upsert=True) for doc in docs],
+                    ordered=False
+                )
+            written += len(docs)
+        return written
+
+    def run(self, full=False):
+        """Full or incremental refresh; the watermarks are the per-collection load positions of the last run"""
+        self.ensure_indexes()
+        state = self.state.find_one({'_id': 'watermark'})
+        # Taken before reading, so rows loaded while this run is in progress are picked up next time
+        watermarks = self.current_watermarks()
+
+        current_period = self.processor.calculate_financial_period(pd.Timestamp(datetime.now()))
+
+        # States from before the load-time watermark ('since' business date) get one full rebuild,
+        # and so does a new financial period, which moves every customer's rolling window
+        if full or state is None or 'collections' not in state or state.get('financial_period') != current_period:
+            written = self.rebuild_customers()
+        else:
+            written = self.rebuild_customers(self.changed_customers(state['collections']))
+
+        self.state.replace_one(
+            {'_id': 'watermark'},
+            {'_id': 'watermark', 'collections': watermarks, 'financial_period': current_period,
+             'updated_at': datetime.now()},
+            upsert=True
+        )
+        return written
+
+
+def get_customer_summary(db, customer_number):
+    """Per-customer drill-through lookup: one indexed read"""
+    return db[SUMMARY_COLLECTION].find_one({'CUSTOMER_NUMBER': str(customer_number)}, {'_id': 0})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Materialize customer_summary documents")
+    parser.add_argument("--full", action="store_true", help="rebuild every customer instead of only changed ones")
+    args = parser.parse_args()
+
+    written = CustomerSummaryBuilder().run(full=args.full)
+    print(f"Wrote {written} customer summaries to {SUMMARY_COLLECTION}")
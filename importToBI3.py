@@ -4,10 +4,92 @@ from pymongo import MongoClient
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 
+try:
+    from pipeline_metrics import instrument, stage
+except ImportError:
+    # Power BI may run this file on its own, without the rest of the repo; timing is then off
+    class _NoStage:
+        rows_in = rows_out = None
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    def stage(name, rows_in=None):
+        return _NoStage()
+
+    def instrument(name=None):
+        return lambda func: func
+
+try:
+    from mongo_access import get_client, read_frame
+except ImportError:
+    # Standalone in Power BI: a plain client per processor and no retries
+    def get_client(uri=None):
+        return MongoClient(uri or "mongodb://localhost:27017/")
+
+    def read_frame(collection, query=None, columns=None, batch_size=10000):
+        projection = {col: 1 for col in columns} if columns else {}
+        projection['_id'] = 0
+        records = list(collection.find(query or {}, projection, batch_size=batch_size))
+        return pd.DataFrame.from_records(records, columns=columns)
+
+try:
+    from source_schema import conform, share_key_categories, table_for_name
+except ImportError:
+    # Standalone in Power BI: frames keep the dtypes pandas infers
+    def conform(df, table, errors=None):
+        return df, df.iloc[0:0]
+
+    def share_key_categories(frames):
+        return frames
+
+    def table_for_name(name):
+        return None
+
 class ClearVueBIProcessor:
-    def __init__(self, mongodb_uri="mongodb://localhost:27017/", db_name="clearvue"):
-        self.client = MongoClient(mongodb_uri)
+    # DataFrame key -> MongoDB collection name
+    COLLECTIONS = {
+        'products': "products",
+        'sales_line': "sales line",
+        'sales_header': "sales header",
+        'trans_types': "trans types",
+        'products_styles': "products styles",
+        'product_brands': "product brands",
+        'product_categories': "product categories",
+        'product_ranges': "product ranges",
+        'purchases_lines': "purchases lines",
+        'purchases_headers': "purchases headers",
+        'suppliers': "suppliers",
+        'representatives': "representatives",
+        'customer': "customer",
+        'customer_categories': "customer categories",
+        'customer_regions': "customer regions",
+        'customer_account_parameters': "customer account parameters",
+        'age_analysis': "age analysis",
+        'payment_lines': "payment lines",
+        'payment_header': "payment header"
+    }
+
+    PURCHASES_HEADER_COLUMNS = ['SUPPLIER_CODE', 'PURCH_DOC_NO', 'PURCH_DATE']
+    PURCHASES_LINE_COLUMNS = ['PURCH_DOC_NO', 'INVENTORY_CODE', 'QUANTITY', 'UNIT_COST_PRICE', 'TOTAL_LINE_COST']
+    SUPPLIER_COLUMNS = ['SUPPLIER_CODE', 'SUPPLIER_DESC', 'EXCLSV', 'NORMAL_PAYTERMS', 'CREDIT_LIMIT']
+
+    AGING_BUCKETS = [
+        'AMT_CURRENT', 'AMT_30_DAYS', 'AMT_60_DAYS', 'AMT_90_DAYS', 'AMT_120_DAYS',
+        'AMT_150_DAYS', 'AMT_180_DAYS', 'AMT_210_DAYS', 'AMT_240_DAYS', 'AMT_270_DAYS',
+        'AMT_300_DAYS', 'AMT_330_DAYS', 'AMT_360_DAYS'
+    ]
+    AGE_ANALYSIS_COLUMNS = ['CUSTOMER_NUMBER', 'FIN_PERIOD', 'TOTAL_DUE'] + AGING_BUCKETS
+
+    def __init__(self, mongodb_uri=None, db_name="clearvue", client=None):
+        # The shared pooled client (MONGODB_URI by default), or an existing client such as a
+        # benchmark's mongomock client
+        self.client = client if client is not None else get_client(mongodb_uri)
         self.db = self.client[db_name]
+        self._calendar_dim = None
     
     def remove_id_columns(self, df):
         """Remove _id columns to avoid merge conflicts"""
@@ -50,6 +132,25 @@ class ClearVueBIProcessor:
         
         return f"{financial_year}-{financial_month:02d}"
 
+    @instrument("bi.calculate_financial_periods")
+    def calculate_financial_periods(self, dates):
+        """
+        Vectorized version of calculate_financial_period for a whole Series of dates.
+        A date falls in its calendar month unless it is after that month's last Friday,
+        in which case it belongs to the next financial month.
+        """
+        dates = pd.to_datetime(pd.Series(dates), errors='coerce')
+
+        month_end = dates.dt.normalize() + pd.offsets.MonthEnd(0)
+        last_friday = month_end - pd.to_timedelta((month_end.dt.weekday - 4) % 7, unit='D')
+
+        periods = dates.dt.to_period('M')
+        # Compare calendar days: any time on the last Friday still belongs to this month
+        periods = periods.where(dates.dt.normalize() <= last_friday, periods + 1)
+
+        return periods.dt.strftime('%Y-%m').where(dates.notna(), None)
+
+    @instrument("bi.calendar_dim")
     def create_financial_calendar_dimension(self, start_date='2018-01-01', end_date='2025-12-31'):
         """
         Creates a comprehensive date dimension table for Power BI.
@@ -68,71 +169,92 @@ class ClearVueBIProcessor:
         
         return calendar_df
 
-    def load_all_collections(self):
-        """Load all MongoDB collections into DataFrames and remove _id columns"""
+    def get_financial_calendar_dimension(self):
+        """The default calendar dimension, built once per processor and reused on every refresh"""
+        if self._calendar_dim is None:
+            self._calendar_dim = self.create_financial_calendar_dimension()
+        return self._calendar_dim
+
+    @instrument("bi.load_collection")
+    def load_collection(self, collection_name, columns=None, query=None):
+        """
+        Load a single MongoDB collection into a DataFrame.
+        Only the requested columns are projected on the server and _id is never returned.
+        Source tables are cast to their declared dtypes (see source_schema.py).
+        """
+        df = read_frame(self.db[collection_name], query, columns)
+
+        table = table_for_name(collection_name)
+        if table is not None:
+            df, _ = conform(df, table)
+        return df
+
+    @instrument("bi.load_all_collections")
+    def load_all_collections(self, exclude=()):
+        """Load all MongoDB collections (except the `exclude` keys) into DataFrames and remove _id columns"""
         collections = {
-            'products': self.remove_id_columns(pd.DataFrame(list(self.db["products"].find()))),
-            'sales_line': self.remove_id_columns(pd.DataFrame(list(self.db["sales line"].find()))),
-            'sales_header': self.remove_id_columns(pd.DataFrame(list(self.db["sales header"].find()))),
-            'trans_types': self.remove_id_columns(pd.DataFrame(list(self.db["trans types"].find()))),
-            'products_styles': self.remove_id_columns(pd.DataFrame(list(self.db["products styles"].find()))),
-            'product_brands': self.remove_id_columns(pd.DataFrame(list(self.db["product brands"].find()))),
-            'product_categories': self.remove_id_columns(pd.DataFrame(list(self.db["product categories"].find()))),
-            'product_ranges': self.remove_id_columns(pd.DataFrame(list(self.db["product ranges"].find()))),
-            'purchases_lines': self.remove_id_columns(pd.DataFrame(list(self.db["purchases lines"].find()))),
-            'purchases_headers': self.remove_id_columns(pd.DataFrame(list(self.db["purchases headers"].find()))),
-            'suppliers': self.remove_id_columns(pd.DataFrame(list(self.db["suppliers"].find()))),
-            'representatives': self.remove_id_columns(pd.DataFrame(list(self.db["representatives"].find()))),
-            'customer': self.remove_id_columns(pd.DataFrame(list(self.db["customer"].find()))),
-            'customer_categories': self.remove_id_columns(pd.DataFrame(list(self.db["customer categories"].find()))),
-            'customer_regions': self.remove_id_columns(pd.DataFrame(list(self.db["customer regions"].find()))),
-            'customer_account_parameters': self.remove_id_columns(pd.DataFrame(list(self.db["customer account parameters"].find()))),
-            'age_analysis': self.remove_id_columns(pd.DataFrame(list(self.db["age analysis"].find()))),
-            'payment_lines': self.remove_id_columns(pd.DataFrame(list(self.db["payment lines"].find()))),
-            'payment_header': self.remove_id_columns(pd.DataFrame(list(self.db["payment header"].find())))
+            key: self.load_collection(collection_name)
+            for key, collection_name in self.COLLECTIONS.items()
+            if key not in exclude
         }
-        return collections
+        # One categorical dtype per key column, so the merges below join on integer codes
+        return share_key_categories(collections)
 
+    @instrument("bi.sales_fact")
     def create_sales_fact_table(self, collections):
         """Create comprehensive sales fact table"""
+        # No-op when the keys already share categories (load_all_collections)
+        collections = share_key_categories(collections)
+
         # First merge sales header and line
-        sales_fact = pd.merge(
-            collections['sales_header'], 
-            collections['sales_line'], 
-            on="DOC_NUMBER", 
-            how="left"
-        )
+        with stage("bi.sales_fact.merge_sales_line", rows_in=len(collections['sales_header'])) as s:
+            sales_fact = pd.merge(
+                collections['sales_header'], 
+                collections['sales_line'], 
+                on="DOC_NUMBER", 
+                how="left"
+            )
+            s.rows_out = len(sales_fact)
         
         # Then merge with trans_types
-        sales_fact = pd.merge(
-            sales_fact, 
-            collections['trans_types'], 
-            on="TRANSTYPE_CODE", 
-            how="left"
-        )
+        with stage("bi.sales_fact.merge_trans_types", rows_in=len(sales_fact)) as s:
+            sales_fact = pd.merge(
+                sales_fact, 
+                collections['trans_types'], 
+                on="TRANSTYPE_CODE", 
+                how="left"
+            )
+            s.rows_out = len(sales_fact)
         
         # Then merge with products
-        sales_fact = pd.merge(
-            sales_fact, 
-            collections['products'], 
-            on="INVENTORY_CODE", 
-            how="left"
-        )
+        with stage("bi.sales_fact.merge_products", rows_in=len(sales_fact)) as s:
+            sales_fact = pd.merge(
+                sales_fact, 
+                collections['products'], 
+                on="INVENTORY_CODE", 
+                how="left"
+            )
+            s.rows_out = len(sales_fact)
         
         # Finally merge with products_styles
-        sales_fact = pd.merge(
-            sales_fact, 
-            collections['products_styles'], 
-            on="INVENTORY_CODE", 
-            how="left"
-        )
+        with stage("bi.sales_fact.merge_products_styles", rows_in=len(sales_fact)) as s:
+            sales_fact = pd.merge(
+                sales_fact, 
+                collections['products_styles'], 
+                on="INVENTORY_CODE", 
+                how="left"
+            )
+            s.rows_out = len(sales_fact)
         
         # Add financial period calculation
         if 'TRANS_DATE' in sales_fact.columns:
-            sales_fact['FINANCIAL_PERIOD'] = sales_fact['TRANS_DATE'].apply(self.calculate_financial_period)
+            with stage("bi.sales_fact.financial_period", rows_in=len(sales_fact)) as s:
+                sales_fact['FINANCIAL_PERIOD'] = self.calculate_financial_periods(sales_fact['TRANS_DATE'])
+                s.rows_out = len(sales_fact)
         
         return sales_fact
 
+    @instrument("bi.customer_dim")
     def create_customer_dimension(self, collections):
         """Create customer dimension table"""
         # Start with customer table
@@ -166,6 +288,7 @@ class ClearVueBIProcessor:
         
         return customer_dim
 
+    @instrument("bi.product_dim")
     def create_product_dimension(self, collections):
         """Create comprehensive product dimension"""
         product_dim = collections['products'].copy()
@@ -198,71 +321,210 @@ class ClearVueBIProcessor:
         
         return product_dim
 
+    @instrument("bi.payment_fact")
     def create_payment_fact_table(self, collections):
         """Create payment fact table"""
-        payment_fact = pd.merge(
-            collections['payment_lines'],
-            collections['payment_header'],
-            on=["CUSTOMER_NUMBER", "DEPOSIT_REF"],
-            how="left"
-        )
+        with stage("bi.payment_fact.merge_payment_header", rows_in=len(collections['payment_lines'])) as s:
+            payment_fact = pd.merge(
+                collections['payment_lines'],
+                collections['payment_header'],
+                on=["CUSTOMER_NUMBER", "DEPOSIT_REF"],
+                how="left"
+            )
+            s.rows_out = len(payment_fact)
         
         # Add financial period calculation
         if 'DEPOSIT_DATE' in payment_fact.columns:
-            payment_fact['FINANCIAL_PERIOD'] = payment_fact['DEPOSIT_DATE'].apply(self.calculate_financial_period)
+            with stage("bi.payment_fact.financial_period", rows_in=len(payment_fact)) as s:
+                payment_fact['FINANCIAL_PERIOD'] = self.calculate_financial_periods(payment_fact['DEPOSIT_DATE'])
+                s.rows_out = len(payment_fact)
         
         return payment_fact
 
-    def generate_power_bi_datasets(self):
-        """Generate all datasets for Power BI"""
-        collections = self.load_all_collections()
-        
+    @instrument("bi.load_purchases_collections")
+    def load_purchases_collections(self, since=None):
+        """
+        Load only the columns the purchases fact needs.
+        When since is given, only purchases dated on or after it (and their lines) are read.
+        """
+        header_query = {'PURCH_DATE': {'$gte': since}} if since is not None else None
+        purchases_headers = self.load_collection(
+            self.COLLECTIONS['purchases_headers'], self.PURCHASES_HEADER_COLUMNS, header_query
+        )
+
+        line_query = None
+        if since is not None:
+            line_query = {'PURCH_DOC_NO': {'$in': purchases_headers['PURCH_DOC_NO'].tolist()}}
+        purchases_lines = self.load_collection(
+            self.COLLECTIONS['purchases_lines'], self.PURCHASES_LINE_COLUMNS, line_query
+        )
+
+        suppliers = self.load_collection(self.COLLECTIONS['suppliers'], self.SUPPLIER_COLUMNS)
+
+        return {
+            'purchases_headers': purchases_headers,
+            'purchases_lines': purchases_lines,
+            'suppliers': suppliers
+        }
+
+    @instrument("bi.purchases_fact")
+    def create_purchases_fact_table(self, collections):
+        """Create purchases fact table with supplier spend per line"""
+        # Merge purchases header and line
+        purchases_fact = pd.merge(
+            collections['purchases_headers'],
+            collections['purchases_lines'],
+            on="PURCH_DOC_NO",
+            how="left"
+        )
+
+        # Then merge with suppliers
+        purchases_fact = pd.merge(
+            purchases_fact,
+            collections['suppliers'],
+            on="SUPPLIER_CODE",
+            how="left"
+        )
+
+        # Add financial period calculation
+        if 'PURCH_DATE' in purchases_fact.columns:
+            purchases_fact['FINANCIAL_PERIOD'] = self.calculate_financial_periods(purchases_fact['PURCH_DATE'])
+
+        return purchases_fact
+
+    @instrument("bi.append_purchases_fact")
+    def append_purchases_fact(self, purchases_fact):
+        """
+        Incrementally refresh an existing purchases fact table.
+        Only purchases dated on or after the latest PURCH_DATE already loaded are read, each with
+        all of its lines; those documents replace their earlier rows, so lines added to an already
+        loaded document are picked up. Older documents change only with a full rebuild.
+        """
+        since = None
+        if not purchases_fact.empty and purchases_fact['PURCH_DATE'].notna().any():
+            since = pd.Timestamp(purchases_fact['PURCH_DATE'].max()).to_pydatetime()
+
+        reread = self.create_purchases_fact_table(self.load_purchases_collections(since))
+        if reread.empty:
+            return purchases_fact
+
+        kept = purchases_fact[~purchases_fact['PURCH_DOC_NO'].isin(reread['PURCH_DOC_NO'])]
+        return pd.concat([kept, reread], ignore_index=True)
+
+    @staticmethod
+    def normalize_age_analysis(age_analysis):
+        """Give the age analysis stable dtypes: string customer keys, int FIN_PERIOD, float amounts"""
+        columns = ClearVueBIProcessor.AGE_ANALYSIS_COLUMNS
+        df = age_analysis[[col for col in columns if col in age_analysis.columns]].copy()
+
+        df['CUSTOMER_NUMBER'] = df['CUSTOMER_NUMBER'].astype(str)
+        df['FIN_PERIOD'] = pd.to_numeric(df['FIN_PERIOD'], errors='coerce')
+        df = df[df['FIN_PERIOD'].notna()]
+        df['FIN_PERIOD'] = df['FIN_PERIOD'].astype('int64')
+
+        for col in columns[2:]:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0).astype('float64')
+
+        return df
+
+    @staticmethod
+    def compute_aging_deltas(age_analysis):
+        """
+        Compute each customer's movement per aging bucket against their previous snapshot.
+        The first snapshot of every customer has no previous period, so its deltas are NaN.
+        """
+        df = ClearVueBIProcessor.normalize_age_analysis(age_analysis)
+        df = df.sort_values(['CUSTOMER_NUMBER', 'FIN_PERIOD'], kind='mergesort').reset_index(drop=True)
+
+        amount_columns = [col for col in ClearVueBIProcessor.AGE_ANALYSIS_COLUMNS[2:] if col in df.columns]
+        by_customer = df.groupby('CUSTOMER_NUMBER', sort=False)
+        deltas = by_customer[amount_columns].diff()
+        deltas.columns = [f"{col}_DELTA" for col in amount_columns]
+
+        df['PREV_FIN_PERIOD'] = by_customer['FIN_PERIOD'].shift()
+
+        # FIN_PERIOD is YYYYMM; the other facts use 'YYYY-MM'
+        fin_period = df['FIN_PERIOD'].astype(str)
+        df['FINANCIAL_PERIOD'] = fin_period.str[:4] + '-' + fin_period.str[4:]
+
+        return pd.concat([df, deltas], axis=1)
+
+    @instrument("bi.aging_trend_fact")
+    def create_aging_trend_fact(self, collections):
+        """Create the debtor aging trend fact: one row per customer per age analysis snapshot"""
+        return self.compute_aging_deltas(collections['age_analysis'])
+
+    @instrument("bi.generate_power_bi_datasets")
+    def generate_power_bi_datasets(self, purchases_fact=None):
+        """
+        Generate all datasets for Power BI.
+        With a previously built purchases_fact, only the new purchases are read and appended to it.
+        """
+        purchases_keys = ('purchases_headers', 'purchases_lines', 'suppliers')
+        if purchases_fact is None:
+            collections = self.load_all_collections()
+            purchases_fact = self.create_purchases_fact_table({key: collections[key] for key in purchases_keys})
+            suppliers = collections['suppliers']
+        else:
+            collections = self.load_all_collections(exclude=purchases_keys)
+            purchases_fact = self.append_purchases_fact(purchases_fact)
+            suppliers = self.load_collection(self.COLLECTIONS['suppliers'])
+
         datasets = {
             'sales_fact': self.create_sales_fact_table(collections),
             'customer_dim': self.create_customer_dimension(collections),
             'product_dim': self.create_product_dimension(collections),
             'payment_fact': self.create_payment_fact_table(collections),
-            'suppliers_dim': collections['suppliers'],
+            'purchases_fact': purchases_fact,
+            'aging_trend_fact': self.create_aging_trend_fact(collections),
+            'suppliers_dim': suppliers,
             'representatives_dim': collections['representatives'],
-            'calendar_dim': self.create_financial_calendar_dimension()
+            'calendar_dim': self.get_financial_calendar_dimension()
         }
         
         return datasets
 
 # --- MAIN EXECUTION ---
 # This part runs when the script is executed in Power BI
+# (Power BI runs the script as __main__; other modules can import the processor without a full build)
 
-try:
-    # 1. Create the processor
-    processor = ClearVueBIProcessor()
-
-    # 2. Generate all the datasets
-    datasets = processor.generate_power_bi_datasets()
-
-    # 3. Assign each dataset to a variable
-    # These variables will appear in Power BI's Navigator window for you to select
-    sales_fact = datasets['sales_fact']
-    customer_dim = datasets['customer_dim']
-    product_dim = datasets['product_dim']
-    payment_fact = datasets['payment_fact']
-    suppliers_dim = datasets['suppliers_dim']
-    representatives_dim = datasets['representatives_dim']
-    calendar_dim = datasets['calendar_dim']
-
-    # Optional: Print the shape of each dataset to verify in Power BI's output console
-    print("Data Extraction Complete!")
-    print(f"Sales Fact: {sales_fact.shape} rows, {sales_fact.shape[1]} columns")
-    print(f"Customer Dimension: {customer_dim.shape} rows, {customer_dim.shape[1]} columns")
-    print(f"Product Dimension: {product_dim.shape} rows, {product_dim.shape[1]} columns")
-    print(f"Payment Fact: {payment_fact.shape} rows, {payment_fact.shape[1]} columns")
-    print(f"Calendar Dimension: {calendar_dim.shape} rows, {calendar_dim.shape[1]} columns")
+if __name__ == "__main__":
+    try:
+        # 1. Create the processor
+        processor = ClearVueBIProcessor()
+
+        # 2. Generate all the datasets
+        datasets = processor.generate_power_bi_datasets()
+
+        # 3. Assign each dataset to a variable
+        # These variables will appear in Power BI's Navigator window for you to select
+        sales_fact = datasets['sales_fact']
+        customer_dim = datasets['customer_dim']
+        product_dim = datasets['product_dim']
+        payment_fact = datasets['payment_fact']
+        purchases_fact = datasets['purchases_fact']
+        aging_trend_fact = datasets['aging_trend_fact']
+        suppliers_dim = datasets['suppliers_dim']
+        representatives_dim = datasets['representatives_dim']
+        calendar_dim = datasets['calendar_dim']
+
+        # Optional: Print the shape of each dataset to verify in Power BI's output console
+        print("Data Extraction Complete!")
+        print(f"Sales Fact: {sales_fact.shape} rows, {sales_fact.shape[1]} columns")
+        print(f"Customer Dimension: {customer_dim.shape} rows, {customer_dim.shape[1]} columns")
+        print(f"Product Dimension: {product_dim.shape} rows, {product_dim.shape[1]} columns")
+        print(f"Payment Fact: {payment_fact.shape} rows, {payment_fact.shape[1]} columns")
+        print(f"Purchases Fact: {purchases_fact.shape} rows, {purchases_fact.shape[1]} columns")
+        print(f"Aging Trend Fact: {aging_trend_fact.shape} rows, {aging_trend_fact.shape[1]} columns")
+        print(f"Calendar Dimension: {calendar_dim.shape} rows, {calendar_dim.shape[1]} columns")
     
-    # Show column names to help with relationship building
-    print("\nKey columns for relationships:")
-    print(f"Sales Fact columns: {[col for col in sales_fact.columns if 'CUSTOMER' in col or 'INVENTORY' in col or 'PERIOD' in col]}")
-    print(f"Customer Dimension columns: {[col for col in customer_dim.columns if 'CUSTOMER' in col]}")
-    print(f"Product Dimension columns: {[col for col in product_dim.columns if 'INVENTORY' in col]}")
-
-except Exception as e:
-    print(f"Error occurred: {str(e)}")
-    print("Please make sure MongoDB is running and the collections exist.")
\ No newline at end of file
+        # Show column names to help with relationship building
+        print("\nKey columns for relationships:")
+        print(f"Sales Fact columns: {[col for col in sales_fact.columns if 'CUSTOMER' in col or 'INVENTORY' in col or 'PERIOD' in col]}")
+        print(f"Customer Dimension columns: {[col for col in customer_dim.columns if 'CUSTOMER' in col]}")
+        print(f"Product Dimension columns: {[col for col in product_dim.columns if 'INVENTORY' in col]}")
+
+    except Exception as e:
+        print(f"Error occurred: {str(e)}")
+        print("Please make sure MongoDB is running and the collections exist.")
\ No newline at end of file
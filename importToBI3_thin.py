@@ -0,0 +1,60 @@
+# Thin-client version of importToBI3.py for Power BI
+# Fetches the ready datasets from the BI warm worker (bi_warm_worker.py) instead of
+# connecting to MongoDB and building everything in Power BI's fresh interpreter.
+# Only pandas and pyarrow are imported, so the cold start stays small.
+#
+# Start the worker first (outside Power BI):  python bi_warm_worker.py
+
+import json
+import os
+import socket
+
+import pyarrow as pa
+
+WORKER_HOST = os.environ.get("CLEARVUE_BI_WORKER_HOST", "127.0.0.1")
+WORKER_PORT = int(os.environ.get("CLEARVUE_BI_WORKER_PORT", "8765"))
+
+
+def fetch_datasets(names=None, refresh=False, host=WORKER_HOST, port=WORKER_PORT, timeout=600):
+    """Fetch datasets from the warm worker as a dict of DataFrames"""
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        request = {"datasets": names, "refresh": refresh, "timeout": timeout}
+        sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+
+        stream = sock.makefile("rb")
+        header = json.loads(stream.readline())
+        if not header.get("ok"):
+            raise RuntimeError(header.get("error"))
+
+        datasets = {}
+        for entry in header["datasets"]:
+            payload = stream.read(entry["bytes"])
+            datasets[entry["name"]] = pa.ipc.open_stream(payload).read_pandas()
+        return datasets
+
+
+# --- MAIN EXECUTION ---
+# This part runs when the script is executed in Power BI
+
+if __name__ == "__main__":
+    try:
+        datasets = fetch_datasets()
+
+        # These variables will appear in Power BI's Navigator window for you to select
+        sales_fact = datasets['sales_fact']
+        customer_dim = datasets['customer_dim']
+        product_dim = datasets['product_dim']
+        payment_fact = datasets['payment_fact']
+        purchases_fact = datasets['purchases_fact']
+        aging_trend_fact = datasets['aging_trend_fact']
+        suppliers_dim = datasets['suppliers_dim']
+        representatives_dim = datasets['representatives_dim']
+        calendar_dim = datasets['calendar_dim']
+
+        print("Data Extraction Complete!")
+        for name, df in datasets.items():
+            print(f"{name}: {df.shape[0]} rows, {df.shape[1]} columns")
+
+    except Exception as e:
+        print(f"Error occurred: {str(e)}")
+        print("Please make sure the BI warm worker (bi_warm_worker.py) is running.")
@@ -1,31 +1,33 @@
 import os
-import pandas as pd
-from pymongo import MongoClient
+from mongo_access import get_database, write_batches
+from source_schema import SCHEMA_ERRORS, iter_source_chunks, to_documents
 
 def import_excel_files(folder_path):
     try:
-        # Connect to local MongoDB
-        client = MongoClient("mongodb://localhost:27017/")
-        db = client["clearvue"]  
+        # Shared pooled client (MONGODB_URI, localhost by default)
+        db = get_database("clearvue")
 
         # List all files in the folder
         for file in os.listdir(folder_path):
             if file.endswith(".xlsx") or file.endswith(".xls"):
                 file_path = os.path.join(folder_path, file)
 
-                # Read Excel file into DataFrame
-                df = pd.read_excel(file_path)
-
-                if not df.empty:
-                    # Use filename (without extension) as collection name
-                    collection_name = os.path.splitext(file)[0].lower()
-                    collection = db[collection_name]
-
-                    # Convert DataFrame to list of dicts and insert
-                    data = df.to_dict(orient="records")
-                    collection.insert_many(data)
-
-                    print(f" Imported {len(data)} records into '{collection_name}' collection")
+                # Use filename (without extension) as collection name
+                collection_name = os.path.splitext(file)[0].lower()
+                collection = db[collection_name]
+
+                # Stream the workbook in chunks, cast to the declared source schema (source_schema.py)
+                imported = 0
+                mismatched = 0
+                for table, chunk, bad in iter_source_chunks(file_path):
+                    mismatched += len(bad)
+                    if not chunk.empty:
+                        imported += write_batches(collection, to_documents(chunk), sink="excel_import")
+
+                if mismatched:
+                    print(f" {mismatched} rows in '{file}' did not match the {table} schema ({SCHEMA_ERRORS})")
+                if imported:
+                    print(f" Imported {imported} records into '{collection_name}' collection")
 
         print("All Excel files imported successfully!")
 
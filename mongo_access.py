@@ -0,0 +1,337 @@
+# Shared MongoDB access layer
+# One pooled MongoClient per process (and per URI), configured from the environment,
+# plus batched read/write helpers that retry on transient errors.
+#
+# Environment (all optional):
+#   MONGODB_URI                          default mongodb://localhost:27017/ (docker-compose sets it)
+#   MONGODB_MAX_POOL_SIZE / MONGODB_MIN_POOL_SIZE
+#   MONGODB_MAX_IDLE_TIME_MS
+#   MONGODB_CONNECT_TIMEOUT_MS / MONGODB_SERVER_SELECTION_TIMEOUT_MS / MONGODB_SOCKET_TIMEOUT_MS
+#   MONGODB_WRITE_CONCERN                e.g. 1, majority
+#   MONGODB_JOURNAL                      1/true to wait for the journal
+#   MONGODB_READ_PREFERENCE              e.g. primary, secondaryPreferred
+#   MONGODB_RETRIES                      attempts for transient errors (default 3)
+#   CLEARVUE_LOAD_PROFILE                bulk load profile for every sink, e.g. backfill
+#   CLEARVUE_LOAD_PROFILE_<SINK>         per-sink profile, e.g. CLEARVUE_LOAD_PROFILE_SALES_FACT=safe,batch_size=500
+
+import os
+import threading
+import time
+
+import pandas as pd
+from pymongo import MongoClient, WriteConcern
+from pymongo.errors import AutoReconnect, BulkWriteError, ConnectionFailure, NetworkTimeout, OperationFailure
+
+DEFAULT_URI = "mongodb://localhost:27017/"
+DEFAULT_BATCH_SIZE = 10000
+
+# Server error codes that are safe to retry (network/election/shutdown related)
+TRANSIENT_ERROR_CODES = {6, 7, 89, 91, 189, 262, 9001, 10107, 11600, 11602, 13435, 13436}
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def client_options():
+    """MongoClient keyword options built from the environment"""
+    options = {
+        'maxPoolSize': _env_int("MONGODB_MAX_POOL_SIZE", 50),
+        'minPoolSize': _env_int("MONGODB_MIN_POOL_SIZE", 0),
+        'maxIdleTimeMS': _env_int("MONGODB_MAX_IDLE_TIME_MS", 300000),
+        'connectTimeoutMS': _env_int("MONGODB_CONNECT_TIMEOUT_MS", 10000),
+        'serverSelectionTimeoutMS': _env_int("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 10000),
+        'retryWrites': True,
+        'retryReads': True,
+        'appname': "clearvue-pipeline"
+    }
+
+    socket_timeout = _env_int("MONGODB_SOCKET_TIMEOUT_MS", None)
+    if socket_timeout is not None:
+        options['socketTimeoutMS'] = socket_timeout
+
+    write_concern = os.environ.get("MONGODB_WRITE_CONCERN")
+    if write_concern:
+        options['w'] = int(write_concern) if write_concern.isdigit() else write_concern
+
+    journal = os.environ.get("MONGODB_JOURNAL")
+    if journal:
+        options['journal'] = journal.lower() in ("1", "true", "yes")
+
+    read_preference = os.environ.get("MONGODB_READ_PREFERENCE")
+    if read_preference:
+        options['readPreference'] = read_preference
+
+    return options
+
+
+def get_client(uri=None):
+    """
+    The process-wide pooled client for `uri` (MONGODB_URI by default).
+    A forked child process gets its own client, since MongoClient is not fork-safe.
+    """
+    uri = uri or os.environ.get("MONGODB_URI", DEFAULT_URI)
+    key = (uri, os.getpid())
+
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = MongoClient(uri, **client_options())
+                _clients[key] = client
+    return client
+
+
+def get_database(name=None, uri=None):
+    """A database on the shared client; without a name, the URI's database (or 'clearvue')"""
+    client = get_client(uri)
+    if name is None:
+        return client.get_default_database("clearvue")
+    return client[name]
+
+
+def close_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+def is_transient(error):
+    if isinstance(error, (AutoReconnect, NetworkTimeout, ConnectionFailure)):
+        return True
+    if isinstance(error, BulkWriteError):
+        # e.g. NotWritablePrimary on part of a batch during a failover
+        errors = error.details.get('writeErrors', [])
+        return bool(errors) and all(err.get('code') in TRANSIENT_ERROR_CODES for err in errors)
+    if isinstance(error, OperationFailure) and not isinstance(error, BulkWriteError):
+        return (error.code in TRANSIENT_ERROR_CODES
+                or error.has_error_label('TransientTransactionError')
+                or error.has_error_label('RetryableWriteError'))
+    return False
+
+
+def with_retry(operation, retries=None, backoff=0.5):
+    """Run operation(), retrying transient errors with exponential backoff"""
+    retries = retries or _env_int("MONGODB_RETRIES", 3)
+    for attempt in range(1, retries + 1):
+        try:
+            return operation()
+        except Exception as e:
+            if attempt == retries or not is_transient(e):
+                raise
+            time.sleep(backoff * (2 ** (attempt - 1)))
+
+
+def read_frame(collection, query=None, columns=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Read a (projected) query into a DataFrame, fetching `batch_size` documents per round trip"""
+    projection = {col: 1 for col in columns} if columns else {}
+    projection['_id'] = 0
+
+    def read():
+        return list(collection.find(query or {}, projection, batch_size=batch_size))
+
+    return pd.DataFrame.from_records(with_retry(read), columns=columns)
+
+
+class BulkLoadProfile:
+    """
+    How a sink writes: ordered/unordered inserts, write concern (w/j), batch size and how many
+    batches are in flight at once. With adaptive=True the batch size is tuned from the measured
+    latency of each batch towards target_batch_seconds.
+    """
+
+    FIELDS = ('ordered', 'w', 'j', 'batch_size', 'concurrency', 'adaptive',
+              'target_batch_seconds', 'min_batch_size', 'max_batch_size')
+
+    def __init__(self, name, ordered=False, w=None, j=None, batch_size=DEFAULT_BATCH_SIZE, concurrency=1,
+                 adaptive=False, target_batch_seconds=0.5, min_batch_size=500, max_batch_size=100000):
+        self.name = name
+        self.ordered = ordered
+        self.w = w
+        self.j = j
+        self.batch_size = batch_size
+        # Ordered loads must keep batches in sequence
+        self.concurrency = 1 if ordered else max(1, concurrency)
+        self.adaptive = adaptive
+        self.target_batch_seconds = target_batch_seconds
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+
+    def with_overrides(self, **overrides):
+        values = {field: getattr(self, field) for field in self.FIELDS}
+        values.update(overrides)
+        return BulkLoadProfile(self.name, **values)
+
+    def write_concern(self):
+        if self.w is None and self.j is None:
+            return None
+        return WriteConcern(w=self.w, j=self.j)
+
+    def as_dict(self):
+        return dict({'name': self.name}, **{field: getattr(self, field) for field in self.FIELDS})
+
+
+LOAD_PROFILES = {
+    # Unordered 10k batches with the server's default write concern
+    'default': BulkLoadProfile('default'),
+    # Initial backfill: acknowledged by the primary only, no journal wait, parallel adaptive batches
+    'backfill': BulkLoadProfile('backfill', ordered=False, w=1, j=False, batch_size=10000, concurrency=4, adaptive=True),
+    # Steady-state loads: majority + journal, ordered, small batches
+    'safe': BulkLoadProfile('safe', ordered=True, w='majority', j=True, batch_size=1000)
+}
+
+
+def _parse_value(value):
+    lowered = value.lower()
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    if lowered in ("none", "null"):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def parse_profile(spec):
+    """'backfill' or 'backfill,batch_size=5000,w=majority' -> BulkLoadProfile"""
+    name, *overrides = [part.strip() for part in spec.split(",") if part.strip()]
+    if name not in LOAD_PROFILES:
+        raise ValueError(f"Unknown bulk load profile '{name}', expected one of {sorted(LOAD_PROFILES)}")
+
+    values = {}
+    for override in overrides:
+        key, _, value = override.partition("=")
+        if key not in BulkLoadProfile.FIELDS:
+            raise ValueError(f"Unknown bulk load profile option '{key}'")
+        values[key] = _parse_value(value)
+    return LOAD_PROFILES[name].with_overrides(**values)
+
+
+def get_load_profile(sink=None):
+    """
+    The profile for a sink: CLEARVUE_LOAD_PROFILE_<SINK> if set, else CLEARVUE_LOAD_PROFILE,
+    else 'default'. Values use the parse_profile() syntax.
+    """
+    spec = None
+    if sink:
+        spec = os.environ.get(f"CLEARVUE_LOAD_PROFILE_{sink.upper()}")
+    spec = spec or os.environ.get("CLEARVUE_LOAD_PROFILE") or "default"
+    return parse_profile(spec)
+
+
+def profiled_collection(collection, profile):
+    """The collection with the profile's write concern applied"""
+    write_concern = profile.write_concern()
+    return collection.with_options(write_concern=write_concern) if write_concern else collection
+
+
+class AdaptiveBatchSizer:
+    """Moves the batch size towards the size that takes target_batch_seconds to write"""
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.batch_size = profile.batch_size or DEFAULT_BATCH_SIZE
+        self._lock = threading.Lock()
+
+    def observe(self, docs, seconds):
+        if not self.profile.adaptive or seconds <= 0 or docs == 0:
+            return
+        with self._lock:
+            ideal = docs * self.profile.target_batch_seconds / seconds
+            # Damped step so one slow batch does not collapse the size
+            proposed = int(0.5 * self.batch_size + 0.5 * ideal)
+            self.batch_size = max(self.profile.min_batch_size, min(self.profile.max_batch_size, proposed))
+
+
+def _insert_batch(collection, batch, ordered):
+    """
+    insert_many with retries. insert_many assigns the _ids on the client, so when a transient error
+    strikes after part of the batch was written, the retry skips the documents whose assigned _id is
+    already stored; ordered and unordered batches alike resume instead of failing on E11000.
+    """
+    # Documents that came with their own _id are always sent, so a real conflict still raises
+    preset = {id(doc) for doc in batch if '_id' in doc}
+    attempts = []
+
+    def insert():
+        attempts.append(1)
+        pending = batch
+        if len(attempts) > 1:
+            assigned = [doc for doc in batch if '_id' in doc and id(doc) not in preset]
+            stored = {doc['_id'] for doc in collection.find({'_id': {'$in': [d['_id'] for d in assigned]}}, {'_id': 1})}
+            pending = [doc for doc in batch if id(doc) in preset or doc.get('_id') not in stored]
+        written = len(batch) - len(pending)
+        if pending:
+            written += len(collection.insert_many(pending, ordered=ordered).inserted_ids)
+        return written
+
+    return with_retry(insert)
+
+
+def bulk_load(collection, docs, profile=None, sink=None):
+    """
+    Insert docs according to a bulk load profile (by default the sink's configured profile).
+    Returns load statistics: documents, batches, seconds, docs_per_second and final batch size.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    profile = profile or get_load_profile(sink)
+    target = profiled_collection(collection, profile)
+    sizer = AdaptiveBatchSizer(profile)
+    started = time.perf_counter()
+
+    def write(batch):
+        batch_started = time.perf_counter()
+        written = _insert_batch(target, batch, profile.ordered)
+        sizer.observe(len(batch), time.perf_counter() - batch_started)
+        return written
+
+    written = 0
+    batches = 0
+    position = 0
+    with ThreadPoolExecutor(max_workers=profile.concurrency) as pool:
+        in_flight = set()
+        while position < len(docs) or in_flight:
+            while position < len(docs) and len(in_flight) < profile.concurrency:
+                size = sizer.batch_size if profile.batch_size else len(docs)
+                in_flight.add(pool.submit(write, docs[position:position + size]))
+                position += size
+                batches += 1
+
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            written += sum(future.result() for future in done)
+
+    seconds = time.perf_counter() - started
+    return {
+        'profile': profile.name,
+        'documents': written,
+        'batches': batches,
+        'seconds': seconds,
+        'docs_per_second': written / seconds if seconds else None,
+        'final_batch_size': sizer.batch_size
+    }
+
+
+def write_batches(collection, docs, batch_size=None, ordered=None, sink=None):
+    """
+    Insert docs with the sink's bulk load profile; batch_size/ordered override the profile.
+    Returns the number of documents written.
+    """
+    overrides = {}
+    if batch_size is not None:
+        overrides['batch_size'] = batch_size
+    if ordered is not None:
+        overrides['ordered'] = ordered
+    profile = get_load_profile(sink).with_overrides(**overrides)
+    return bulk_load(collection, docs, profile)['documents']
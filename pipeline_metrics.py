@@ -0,0 +1,325 @@
+# Stage timing and profiling for the ClearVue pipelines
+# Records wall time, CPU time, rows in/out and peak Python memory per stage.
+#
+# Switched off by default. Enable with CLEARVUE_METRICS=1 (or metrics.enable()) and,
+# optionally, set:
+#   CLEARVUE_METRICS_OUT=path.json | path.prom   report written at exit (and on every flush)
+#   CLEARVUE_METRICS_FLUSH_SECONDS=60             also write the reports periodically, for
+#                                                 long-running services that never exit cleanly
+#   CLEARVUE_METRICS_MEMORY=1                     tracemalloc peak memory per stage; slows the
+#                                                 code several times over, so do not read the
+#                                                 wall/CPU times of the same run
+#   CLEARVUE_METRICS_RECORDS=1000                 raw records kept for the JSON report
+#   CLEARVUE_PROFILE_OUT=path.prof                cProfile dump (pstats format) written at exit
+#
+# Records are aggregated per stage as they arrive; only the last CLEARVUE_METRICS_RECORDS raw
+# records are kept, so a per-message stage in a service does not grow memory without bound.
+# For sampling profiles of a running process use py-spy from outside: py-spy record --pid <pid>
+
+import atexit
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+
+def count_rows(value):
+    """Best-effort row count for DataFrames, dicts of DataFrames and lists of documents"""
+    if value is None or isinstance(value, (str, bytes)):
+        return None
+    if hasattr(value, 'shape') and getattr(value, 'shape'):
+        return int(value.shape[0])
+    if isinstance(value, dict):
+        counts = [count_rows(v) for v in value.values()]
+        counts = [c for c in counts if c is not None]
+        return sum(counts) if counts else None
+    if isinstance(value, list) and (not value or isinstance(value[0], dict)):
+        return len(value)
+    return None
+
+
+class StageRecord:
+    """Measurements for one execution of a stage"""
+
+    __slots__ = ('stage', 'rows_in', 'rows_out', 'wall_seconds', 'cpu_seconds',
+                 'peak_memory_bytes', '_wall_start', '_cpu_start', '_child_peak')
+
+    def __init__(self, stage, rows_in=None):
+        self.stage = stage
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_memory_bytes = None
+        self._child_peak = 0
+
+    def as_dict(self):
+        return {
+            'stage': self.stage,
+            'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'peak_memory_bytes': self.peak_memory_bytes
+        }
+
+
+class _NullStage:
+    """Handed out while metrics are disabled; accepts rows_in/rows_out and records nothing"""
+
+    rows_in = None
+    rows_out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, metrics, name, rows_in):
+        self.metrics = metrics
+        self.record = StageRecord(name, rows_in)
+
+    def __enter__(self):
+        record = self.record
+        if self.metrics.track_memory and tracemalloc.is_tracing():
+            # Remember the peak reached so far so an enclosing stage does not lose it
+            parent = self.metrics._current()
+            if parent is not None:
+                parent._child_peak = max(parent._child_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self.metrics._push(record)
+        record._cpu_start = time.process_time()
+        record._wall_start = time.perf_counter()
+        return record
+
+    def __exit__(self, exc_type, exc, tb):
+        record = self.record
+        record.wall_seconds = time.perf_counter() - record._wall_start
+        record.cpu_seconds = time.process_time() - record._cpu_start
+        self.metrics._pop()
+
+        if self.metrics.track_memory and tracemalloc.is_tracing():
+            peak = max(tracemalloc.get_traced_memory()[1], record._child_peak)
+            record.peak_memory_bytes = peak
+            parent = self.metrics._current()
+            if parent is not None:
+                parent._child_peak = max(parent._child_peak, peak)
+
+        self.metrics._add(record)
+        return False
+
+
+MAX_RECORDS = int(os.environ.get("CLEARVUE_METRICS_RECORDS", "1000"))
+
+
+class PipelineMetrics:
+    """Process-wide collector of stage records"""
+
+    def __init__(self, max_records=MAX_RECORDS):
+        self.enabled = False
+        self.track_memory = False
+        # Per stage totals (in order of first appearance) plus the most recent raw records
+        self.stages = {}
+        self.records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profiler = None
+        self._flusher = None
+
+    # --- switching on and off ---
+
+    def enable(self, track_memory=False, profile=False):
+        self.enabled = True
+        self.track_memory = track_memory
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if profile and self._profiler is None:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def disable(self):
+        self.enabled = False
+        if self._profiler is not None:
+            self._profiler.disable()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.records.clear()
+
+    # --- recording ---
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _current(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def _push(self, record):
+        self._stack().append(record)
+
+    def _pop(self):
+        self._stack().pop()
+
+    def _add(self, record):
+        with self._lock:
+            self.records.append(record)
+            entry = self.stages.get(record.stage)
+            if entry is None:
+                entry = self.stages[record.stage] = {
+                    'stage': record.stage, 'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                    'rows_in': 0, 'rows_out': 0, 'peak_memory_bytes': 0
+                }
+            entry['calls'] += 1
+            entry['wall_seconds'] += record.wall_seconds
+            entry['cpu_seconds'] += record.cpu_seconds
+            entry['rows_in'] += record.rows_in or 0
+            entry['rows_out'] += record.rows_out or 0
+            entry['peak_memory_bytes'] = max(entry['peak_memory_bytes'], record.peak_memory_bytes or 0)
+
+    def stage(self, name, rows_in=None):
+        """
+        Context manager timing a block of code. Set rows_out on the yielded record:
+
+            with metrics.stage("sales_fact.merge.products", rows_in=len(df)) as s:
+                df = pd.merge(...)
+                s.rows_out = len(df)
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, rows_in)
+
+    def instrument(self, name=None):
+        """
+        Decorator timing every call of a function as a stage.
+        Rows in are counted from the DataFrame/dict/list arguments, rows out from the return value.
+        """
+        def decorator(func):
+            stage_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+
+                counts = [count_rows(a) for a in list(args) + list(kwargs.values())]
+                counts = [c for c in counts if c is not None]
+                with _Stage(self, stage_name, sum(counts) if counts else None) as record:
+                    result = func(*args, **kwargs)
+                    record.rows_out = count_rows(result)
+                return result
+
+            return wrapper
+        return decorator
+
+    # --- reporting ---
+
+    def summary(self):
+        """Totals per stage since the last reset, in order of first appearance"""
+        with self._lock:
+            return [dict(entry) for entry in self.stages.values()]
+
+    def to_json(self, include_records=False):
+        report = {'stages': self.summary()}
+        if include_records:
+            with self._lock:
+                report['records'] = [record.as_dict() for record in self.records]
+        return json.dumps(report, indent=2)
+
+    def to_prometheus(self, prefix="clearvue_stage"):
+        """Prometheus text exposition format, one series per stage"""
+        metrics = [
+            ('calls_total', 'calls', 'counter', 'Number of times the stage ran'),
+            ('wall_seconds_total', 'wall_seconds', 'counter', 'Wall clock time spent in the stage'),
+            ('cpu_seconds_total', 'cpu_seconds', 'counter', 'Process CPU time spent in the stage'),
+            ('rows_in_total', 'rows_in', 'counter', 'Rows passed into the stage'),
+            ('rows_out_total', 'rows_out', 'counter', 'Rows produced by the stage'),
+            ('peak_memory_bytes', 'peak_memory_bytes', 'gauge', 'Peak traced Python memory during the stage'),
+        ]
+        summary = self.summary()
+
+        lines = []
+        for suffix, key, metric_type, help_text in metrics:
+            metric = f"{prefix}_{suffix}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+            for entry in summary:
+                label = entry['stage'].replace('\\', '\\\\').replace('"', '\\"')
+                lines.append(f'{metric}{{stage="{label}"}} {entry[key]}')
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, path):
+        """Write the report as Prometheus text for *.prom/*.txt paths, JSON otherwise"""
+        if path.endswith(('.prom', '.txt')):
+            content = self.to_prometheus()
+        else:
+            content = self.to_json(include_records=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def flush(self, metrics_out=None, profile_out=None):
+        """Write the reports now (defaults: CLEARVUE_METRICS_OUT / CLEARVUE_PROFILE_OUT)"""
+        metrics_out = metrics_out or os.environ.get("CLEARVUE_METRICS_OUT")
+        profile_out = profile_out or os.environ.get("CLEARVUE_PROFILE_OUT")
+        if metrics_out and self.stages:
+            self.write_report(metrics_out)
+        if profile_out:
+            self.dump_profile(profile_out)
+
+    def start_flushing(self, interval):
+        """Flush every `interval` seconds from a daemon thread"""
+        if self._flusher is not None:
+            return
+
+        def flush_forever():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"Error writing pipeline metrics: {e}")
+
+        self._flusher = threading.Thread(target=flush_forever, daemon=True)
+        self._flusher.start()
+
+    def dump_profile(self, path):
+        """Write the cProfile stats (readable by pstats, snakeviz, flameprof ...)"""
+        if self._profiler is None:
+            return
+        self._profiler.disable()
+        self._profiler.dump_stats(path)
+        self._profiler.enable()
+
+
+metrics = PipelineMetrics()
+stage = metrics.stage
+instrument = metrics.instrument
+
+
+if os.environ.get("CLEARVUE_METRICS", "").lower() in ("1", "true", "yes"):
+    metrics.enable(
+        track_memory=os.environ.get("CLEARVUE_METRICS_MEMORY", "0").lower() in ("1", "true", "yes"),
+        profile=bool(os.environ.get("CLEARVUE_PROFILE_OUT"))
+    )
+    atexit.register(metrics.flush)
+    if os.environ.get("CLEARVUE_METRICS_FLUSH_SECONDS"):
+        metrics.start_flushing(float(os.environ["CLEARVUE_METRICS_FLUSH_SECONDS"]))
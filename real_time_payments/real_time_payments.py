@@ -1,19 +1,18 @@
 # File: kafka_payment_consumer.py
 # This runs as a separate service, NOT in Power BI
 
-import datetime
-from kafka import KafkaConsumer
-from pymongo import MongoClient
+from datetime import datetime
 import json
 import time
+from customer_cache import CustomerDimensionCache
 from importToBI3 import ClearVueBIProcessor
-def run_payment_consumer():
-    # Connect to MongoDB
-    client = MongoClient("mongodb://localhost:27017/")
-    db = client["clearvue"]
-    
-    # Create Kafka consumer
-    consumer = KafkaConsumer(
+from mongo_access import get_database, get_load_profile, profiled_collection, with_retry
+from pipeline_metrics import stage
+
+def create_consumer():
+    # Imported here so the load test (benchmarks/payment_load_test.py) can run without kafka-python
+    from kafka import KafkaConsumer
+    return KafkaConsumer(
         'payment-transactions',
         bootstrap_servers=['localhost:9092'],
         value_deserializer=lambda x: json.loads(x.decode('utf-8')),
@@ -21,27 +20,68 @@ def run_payment_consumer():
         enable_auto_commit=True,
         group_id='clearvue-payments-group'
     )
-    
-    print("Payment stream consumer started. Listening for messages...")
-    
-    try:
-        for message in consumer:
-            payment_data = message.value
-            print(f"Received payment: {payment_data}")
-            
-            # Add timestamp and financial period
-            payment_data['processed_at'] = datetime.now()
-            if 'DEPOSIT_DATE' in payment_data:
-                payment_data['FINANCIAL_PERIOD'] = ClearVueBIProcessor.calculate_financial_period(payment_data['DEPOSIT_DATE'])
-            
-            # Store in MongoDB
-            db.payment_stream.insert_one(payment_data)
-            print(f"Payment stored in MongoDB: {payment_data['DEPOSIT_REF']}")
-            
-    except Exception as e:
-        print(f"Error in payment consumer: {e}")
-        time.sleep(5)  # Wait before retrying
-        run_payment_consumer()  # Restart
+
+def process_payment(payment_data, processor, customers, payment_stream):
+    """Add timestamp, financial period and the customer's region/category/rep, then store the payment"""
+    with stage("payments.consume_message", rows_in=1) as s:
+        payment_data['processed_at'] = datetime.now()
+        if 'DEPOSIT_DATE' in payment_data:
+            payment_data['FINANCIAL_PERIOD'] = processor.calculate_financial_period(payment_data['DEPOSIT_DATE'])
+        customers.enrich(payment_data)
+
+        # Store in MongoDB
+        with_retry(lambda: payment_stream.insert_one(payment_data))
+        s.rows_out = 1
+    return payment_data
+
+def run_payment_consumer(consumer_factory=create_consumer, db=None, on_stored=None, log_messages=True):
+    """
+    Consume payments until the consumer's iterator is exhausted (a KafkaConsumer never is), restarting
+    the consumer after errors. on_stored(message, payment_data) is called after each insert.
+    Returns the customer cache, e.g. for its hit/miss stats.
+    """
+    # Connect to MongoDB once; the pooled client is reused across consumer restarts
+    db = db if db is not None else get_database("clearvue")
+    # Write concern from the payment_stream load profile (CLEARVUE_LOAD_PROFILE_PAYMENT_STREAM)
+    payment_stream = profiled_collection(db.payment_stream, get_load_profile("payment_stream"))
+
+    # Financial periods and customer attributes come from memory, not from a query per message
+    processor = ClearVueBIProcessor(client=db.client, db_name=db.name)
+    customers = CustomerDimensionCache(processor).start()
+
+    while True:
+        consumer = None
+        try:
+            # Create Kafka consumer
+            consumer = consumer_factory()
+
+            print("Payment stream consumer started. Listening for messages...")
+
+            for message in consumer:
+                payment_data = message.value
+                if log_messages:
+                    print(f"Received payment: {payment_data}")
+                process_payment(payment_data, processor, customers, payment_stream)
+                if log_messages:
+                    print(f"Payment stored in MongoDB: {payment_data['DEPOSIT_REF']}")
+                if on_stored is not None:
+                    on_stored(message, payment_data)
+
+            print("Payment stream consumer finished")
+            return customers
+
+        except Exception as e:
+            print(f"Error in payment consumer: {e}")
+
+        finally:
+            # Leave the consumer group and drop the broker connections before the next consumer
+            if consumer is not None:
+                try:
+                    consumer.close()
+                except Exception as e:
+                    print(f"Error closing payment consumer: {e}")
+
+        time.sleep(5)  # Wait before retrying, then restart the consumer
 
 if __name__ == "__main__":
-    run_payment_consumer()
\ No newline at end of file
+    run_payment_consumer()
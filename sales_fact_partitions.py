@@ -0,0 +1,203 @@
+# Out-of-core sales fact build
+# Builds sales_fact one partition of `sales header` at a time (per FIN_PERIOD or per calendar
+# month of TRANS_DATE) instead of materializing the whole header x line join at once.
+# Each worker process loads the small dimensions once, then joins and writes its partitions
+# independently, so peak memory depends on the partition size and not on the total history.
+#
+#     python sales_fact_partitions.py --sink parquet --workers 4
+#     python sales_fact_partitions.py --sink mongodb --partition-by month
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from arrow_frames import to_arrow_table
+from importToBI3 import ClearVueBIProcessor
+from mongo_access import write_batches
+from pipeline_metrics import stage
+
+DEFAULT_OUTPUT_DIR = "./snapshots/sales_fact"
+PARTITIONED_COLLECTION = "sales_fact_partitioned"
+# Partition key for headers with a null/missing FIN_PERIOD or TRANS_DATE
+UNKNOWN_PARTITION = "unknown"
+DIMENSION_KEYS = ['trans_types', 'products', 'products_styles']
+
+# Large $in lists are split so a single query never exceeds the BSON document limit
+DOC_NUMBER_BATCH = 20000
+
+# Set per worker process by _init_worker
+_processor = None
+_dimensions = None
+
+
+def ensure_indexes(processor, partition_by='FIN_PERIOD', sink='parquet'):
+    """
+    Index every per-partition query: the header partition key, the sales line DOC_NUMBER $in fetch
+    and the partition delete. Without them each partition is a full collection scan.
+    """
+    processor.db[processor.COLLECTIONS['sales_header']].create_index(
+        [('FIN_PERIOD' if partition_by == 'FIN_PERIOD' else 'TRANS_DATE', 1)]
+    )
+    processor.db[processor.COLLECTIONS['sales_line']].create_index([('DOC_NUMBER', 1)])
+    if sink == 'mongodb':
+        processor.db[PARTITIONED_COLLECTION].create_index([('_partition', 1)])
+
+
+def plan_partitions(processor, partition_by='FIN_PERIOD'):
+    """Return (partition_key, sales header query) pairs covering the whole history, nulls included"""
+    headers = processor.db[processor.COLLECTIONS['sales_header']]
+
+    if partition_by == 'FIN_PERIOD':
+        periods = sorted(p for p in headers.distinct('FIN_PERIOD') if p is not None)
+        plan = [(str(p), {'FIN_PERIOD': p}) for p in periods]
+        # Headers without a period (null or missing) go to their own partition
+        if headers.find_one({'FIN_PERIOD': None}, {'_id': 1}) is not None:
+            plan.append((UNKNOWN_PARTITION, {'FIN_PERIOD': None}))
+        return plan
+
+    if partition_by == 'month':
+        plan = []
+        first = headers.find_one({'TRANS_DATE': {'$ne': None}}, {'TRANS_DATE': 1}, sort=[('TRANS_DATE', 1)])
+        last = headers.find_one({'TRANS_DATE': {'$ne': None}}, {'TRANS_DATE': 1}, sort=[('TRANS_DATE', -1)])
+        if first is not None:
+            months = pd.date_range(pd.Timestamp(first['TRANS_DATE']).replace(day=1), pd.Timestamp(last['TRANS_DATE']), freq='MS')
+            plan = [
+                (start.strftime('%Y-%m'), {'TRANS_DATE': {'$gte': start.to_pydatetime(), '$lt': (start + pd.offsets.MonthBegin(1)).to_pydatetime()}})
+                for start in months
+            ]
+        if headers.find_one({'TRANS_DATE': None}, {'_id': 1}) is not None:
+            plan.append((UNKNOWN_PARTITION, {'TRANS_DATE': None}))
+        return plan
+
+    raise ValueError(f"Unknown partition_by: {partition_by}")
+
+
+def load_sales_partition(processor, header_query):
+    """Load one partition of sales header and only the sales lines that belong to it"""
+    sales_header = processor.load_collection(processor.COLLECTIONS['sales_header'], query=header_query)
+    if sales_header.empty:
+        return sales_header, pd.DataFrame(columns=['DOC_NUMBER'])
+
+    doc_numbers = sales_header['DOC_NUMBER'].dropna().unique().tolist()
+    line_batches = [
+        processor.load_collection(
+            processor.COLLECTIONS['sales_line'],
+            query={'DOC_NUMBER': {'$in': doc_numbers[start:start + DOC_NUMBER_BATCH]}}
+        )
+        for start in range(0, len(doc_numbers), DOC_NUMBER_BATCH)
+    ]
+    return sales_header, pd.concat(line_batches, ignore_index=True)
+
+
+def write_parquet_partition(sales_fact, output_dir, partition_key):
+    path = os.path.join(output_dir, f"partition={partition_key}", "sales_fact.parquet")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    import pyarrow.parquet as pq
+    tmp_path = path + ".tmp"
+    pq.write_table(to_arrow_table(sales_fact), tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+    return path
+
+
+def write_mongodb_partition(processor, sales_fact, partition_key):
+    """Replace the partition's documents in the partitioned sales fact collection"""
+    collection = processor.db[PARTITIONED_COLLECTION]
+    collection.delete_many({'_partition': partition_key})
+
+    sales_fact = sales_fact.astype(object).where(sales_fact.notna(), None)
+    sales_fact['_partition'] = partition_key
+    write_batches(collection, sales_fact.to_dict(orient="records"), sink="sales_fact_partitioned")
+    return f"{processor.db.name}.{PARTITIONED_COLLECTION}"
+
+
+def _init_worker(mongodb_uri, db_name):
+    """Open one client per worker process and keep the small dimensions in memory"""
+    global _processor, _dimensions
+    _processor = ClearVueBIProcessor(mongodb_uri, db_name)
+    _dimensions = {key: _processor.load_collection(_processor.COLLECTIONS[key]) for key in DIMENSION_KEYS}
+
+
+def build_partition(partition_key, header_query, sink, output_dir):
+    """Join one sales header partition against the in-memory dimensions and write it out"""
+    started = time.perf_counter()
+
+    with stage("sales_fact_partitions.build_partition") as s:
+        sales_header, sales_line = load_sales_partition(_processor, header_query)
+        s.rows_in = len(sales_header)
+        if sales_header.empty:
+            return {'partition': partition_key, 'rows': 0, 'seconds': time.perf_counter() - started, 'target': None}
+
+        collections = dict(_dimensions, sales_header=sales_header, sales_line=sales_line)
+        sales_fact = _processor.create_sales_fact_table(collections)
+        s.rows_out = len(sales_fact)
+
+        if sink == 'parquet':
+            target = write_parquet_partition(sales_fact, output_dir, partition_key)
+        else:
+            target = write_mongodb_partition(_processor, sales_fact, partition_key)
+
+    return {'partition': partition_key, 'rows': len(sales_fact), 'seconds': time.perf_counter() - started, 'target': target}
+
+
+def build_sales_fact_partitioned(mongodb_uri=None, db_name="clearvue",
+                                 sink='parquet', output_dir=DEFAULT_OUTPUT_DIR,
+                                 partition_by='FIN_PERIOD', partitions=None, workers=None):
+    """
+    Build sales_fact partition by partition across a process pool.
+    `partitions` restricts the build to the given partition keys (e.g. only the open period).
+    """
+    planner = ClearVueBIProcessor(mongodb_uri, db_name)
+    ensure_indexes(planner, partition_by, sink)
+    plan = plan_partitions(planner, partition_by)
+    if partitions is not None:
+        wanted = {str(p) for p in partitions}
+        plan = [(key, query) for key, query in plan if key in wanted]
+
+    workers = workers or os.cpu_count() or 1
+    print(f"Building {len(plan)} sales_fact partitions with {workers} workers -> {sink}")
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(mongodb_uri, db_name)) as pool:
+        futures = {pool.submit(build_partition, key, query, sink, output_dir): key for key, query in plan}
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"  partition {result['partition']}: {result['rows']} rows in {result['seconds']:.1f}s")
+
+    return sorted(results, key=lambda r: r['partition'])
+
+
+def read_sales_fact_partitions(output_dir=DEFAULT_OUTPUT_DIR, partitions=None, columns=None):
+    """Read back the Parquet output, opening only the requested partitions"""
+    keys = partitions
+    if keys is None:
+        keys = sorted(entry.split("=", 1)[1] for entry in os.listdir(output_dir) if entry.startswith("partition="))
+
+    frames = []
+    for key in keys:
+        path = os.path.join(output_dir, f"partition={key}", "sales_fact.parquet")
+        if os.path.exists(path):
+            frames.append(pd.read_parquet(path, columns=columns))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build sales_fact partition by partition")
+    parser.add_argument("--mongodb-uri", help="defaults to MONGODB_URI / localhost")
+    parser.add_argument("--db-name", default="clearvue")
+    parser.add_argument("--sink", choices=["parquet", "mongodb"], default="parquet")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--partition-by", choices=["FIN_PERIOD", "month"], default="FIN_PERIOD")
+    parser.add_argument("--partitions", nargs="*", help="only rebuild these partition keys")
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    results = build_sales_fact_partitioned(
+        args.mongodb_uri, args.db_name, args.sink, args.output_dir,
+        args.partition_by, args.partitions, args.workers
+    )
+    print(f"Done: {sum(r['rows'] for r in results)} rows in {len(results)} partitions")
@@ -0,0 +1,288 @@
+# Source table schema registry
+# Declared key, measure, date and attribute dtypes for the ClearVue source tables, so a column
+# has the same dtype in every workbook, collection and DataFrame instead of whatever pandas
+# infers per file (e.g. CUSTOMER_NUMBER as int in one collection and str in another).
+#
+# The schema is applied while the Excel workbooks are streamed into MongoDB and again when
+# ClearVueBIProcessor extracts the collections. Rows that do not match are either coerced
+# (unparseable values become null) or rejected, see CLEARVUE_SCHEMA_ERRORS.
+#
+# Column kinds:
+#   code    string key; leading zeros are significant ('0' and '00' are different CCAT codes),
+#           numbers read by Excel as 599000.0 become '599000'
+#   int     integer key or period (nullable Int64)
+#   float   measure (float64)
+#   date    datetime64; Excel serial numbers are converted
+#   text    descriptive attribute (str)
+#
+# Environment:
+#   CLEARVUE_SCHEMA_ERRORS   coerce (default) or reject
+
+import os
+import re
+
+import pandas as pd
+
+SCHEMA_ERRORS = os.environ.get("CLEARVUE_SCHEMA_ERRORS", "coerce")
+EXCEL_EPOCH = "1899-12-30"
+DEFAULT_CHUNK_ROWS = 50000
+
+
+class TableSchema:
+    """Declared dtypes of one source table; keys must be present in every row"""
+
+    def __init__(self, name, keys, measures=None, dates=None, attributes=None):
+        self.name = name
+        self.keys = keys
+        self.measures = measures or {}
+        self.dates = dates or []
+        self.attributes = attributes or []
+
+    @property
+    def columns(self):
+        columns = dict(self.keys)
+        columns.update(self.measures)
+        columns.update({col: 'date' for col in self.dates})
+        columns.update({col: 'text' for col in self.attributes})
+        return columns
+
+
+AGING_BUCKETS = ['AMT_CURRENT', 'AMT_30_DAYS', 'AMT_60_DAYS', 'AMT_90_DAYS', 'AMT_120_DAYS',
+                 'AMT_150_DAYS', 'AMT_180_DAYS', 'AMT_210_DAYS', 'AMT_240_DAYS', 'AMT_270_DAYS',
+                 'AMT_300_DAYS', 'AMT_330_DAYS', 'AMT_360_DAYS']
+
+# Keyed like ClearVueBIProcessor.COLLECTIONS
+SOURCE_SCHEMAS = {schema.name: schema for schema in [
+    TableSchema('sales_header',
+                keys={'DOC_NUMBER': 'code', 'CUSTOMER_NUMBER': 'code', 'REP_CODE': 'code',
+                      'TRANSTYPE_CODE': 'int', 'FIN_PERIOD': 'int'},
+                dates=['TRANS_DATE']),
+    TableSchema('sales_line',
+                keys={'DOC_NUMBER': 'code', 'INVENTORY_CODE': 'code'},
+                measures={'QUANTITY': 'float', 'UNIT_SELL_PRICE': 'float', 'TOTAL_LINE_PRICE': 'float'}),
+    TableSchema('trans_types', keys={'TRANSTYPE_CODE': 'int'}, attributes=['TRANSTYPE_DESC']),
+    TableSchema('products',
+                keys={'INVENTORY_CODE': 'code', 'PRODCAT_CODE': 'code'},
+                measures={'LAST_COST': 'float'},
+                attributes=['STOCK_IND']),
+    TableSchema('products_styles',
+                keys={'INVENTORY_CODE': 'code'},
+                attributes=['GENDER', 'MATERIAL', 'STYLE', 'COLOUR', 'BRANDING', 'QUAL_PROBS']),
+    TableSchema('product_brands', keys={'PRODBRA_CODE': 'int'}, attributes=['PRODBRA_DESC']),
+    TableSchema('product_categories',
+                keys={'PRODCAT_CODE': 'code', 'BRAND_CODE': 'int', 'PRAN_CODE': 'int'},
+                attributes=['PRODCAT_DESC']),
+    TableSchema('product_ranges', keys={'PRAN_CODE': 'int'}, attributes=['PRAN_DESC']),
+    TableSchema('purchases_lines',
+                keys={'PURCH_DOC_NO': 'code', 'INVENTORY_CODE': 'code'},
+                measures={'QUANTITY': 'float', 'UNIT_COST_PRICE': 'float', 'TOTAL_LINE_COST': 'float'}),
+    TableSchema('purchases_headers',
+                keys={'PURCH_DOC_NO': 'code', 'SUPPLIER_CODE': 'code'},
+                dates=['PURCH_DATE']),
+    TableSchema('suppliers',
+                keys={'SUPPLIER_CODE': 'code'},
+                measures={'CREDIT_LIMIT': 'float'},
+                attributes=['SUPPLIER_DESC', 'EXCLSV', 'NORMAL_PAYTERMS']),
+    TableSchema('representatives',
+                keys={'REP_CODE': 'code'},
+                measures={'COMMISSION': 'float'},
+                attributes=['REP_DESC', 'COMM_METHOD']),
+    TableSchema('customer',
+                keys={'CUSTOMER_NUMBER': 'code', 'CCAT_CODE': 'code', 'REGION_CODE': 'code', 'REP_CODE': 'code'},
+                measures={'DISCOUNT': 'float', 'CREDIT_LIMIT': 'float'},
+                attributes=['SETTLE_TERMS', 'NORMAL_PAYTERMS']),
+    TableSchema('customer_categories', keys={'CCAT_CODE': 'code'}, attributes=['CCAT_DESC']),
+    TableSchema('customer_regions', keys={'REGION_CODE': 'code'}, attributes=['REGION_DESC']),
+    TableSchema('customer_account_parameters', keys={'CUSTOMER_NUMBER': 'code'}, attributes=['PARAMETER']),
+    TableSchema('age_analysis',
+                keys={'CUSTOMER_NUMBER': 'code', 'FIN_PERIOD': 'int'},
+                measures={col: 'float' for col in ['TOTAL_DUE'] + AGING_BUCKETS}),
+    TableSchema('payment_lines',
+                keys={'CUSTOMER_NUMBER': 'code', 'DEPOSIT_REF': 'code', 'FIN_PERIOD': 'int'},
+                measures={'BANK_AMT': 'float', 'DISCOUNT': 'float', 'TOT_PAYMENT': 'float'},
+                dates=['DEPOSIT_DATE']),
+    TableSchema('payment_header', keys={'CUSTOMER_NUMBER': 'code', 'DEPOSIT_REF': 'code'})
+]}
+
+CODE_KEYS = sorted({col for schema in SOURCE_SCHEMAS.values() for col, kind in schema.keys.items() if kind == 'code'})
+
+
+def table_for_name(name):
+    """'Sales Header.xlsx', 'sales header' or 'sales_header' -> 'sales_header' (None if not a source table)"""
+    base = os.path.splitext(os.path.basename(name))[0] if name.lower().endswith(('.xlsx', '.xls')) else name
+    table = re.sub(r'[\s\-]+', '_', base.strip().lower())
+    return table if table in SOURCE_SCHEMAS else None
+
+
+def sniff_table(columns):
+    """Guess the source table from a header row: all keys present, most declared columns matched"""
+    columns = set(columns)
+    best, best_score = None, 0
+    for name, schema in SOURCE_SCHEMAS.items():
+        if not set(schema.keys) <= columns:
+            continue
+        score = len(columns & set(schema.columns)) - len(columns - set(schema.columns))
+        if best is None or score > best_score:
+            best, best_score = name, score
+    return best
+
+
+# --- conversion ---
+
+def normalize_code(value):
+    if value is None or value is pd.NA or value is pd.NaT or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value).strip()
+    return text or None
+
+
+def _to_code(values):
+    return values.astype(object).map(normalize_code)
+
+
+def _to_int(values):
+    numeric = pd.to_numeric(values.astype(object), errors='coerce')
+    # 201901.5 is not a period
+    return numeric.where(numeric == numeric.round()).astype('Int64')
+
+
+def _to_float(values):
+    return pd.to_numeric(values.astype(object), errors='coerce').astype('float64')
+
+
+def _to_date(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    values = values.astype(object)
+    serials = pd.to_numeric(values, errors='coerce')
+    dates = pd.to_datetime(values.where(serials.isna()), errors='coerce')
+    from_serials = pd.to_datetime(serials, unit='D', origin=EXCEL_EPOCH, errors='coerce')
+    return dates.where(serials.isna(), from_serials)
+
+
+def _to_text(values):
+    return values.astype(object).map(lambda v: None if v is None or pd.isna(v) else str(v))
+
+
+CONVERTERS = {'code': _to_code, 'int': _to_int, 'float': _to_float, 'date': _to_date, 'text': _to_text}
+
+
+def conform(df, table, errors=None):
+    """
+    Cast df's columns to the declared dtypes of `table`.
+    Returns (conformed, mismatched): mismatched holds the original rows with a missing key or a
+    value that could not be parsed. With errors='coerce' those rows stay in conformed with nulls,
+    with errors='reject' they are dropped from it. Undeclared columns are left as they are.
+    """
+    errors = errors or SCHEMA_ERRORS
+    if errors not in ("coerce", "reject"):
+        raise ValueError(f"errors must be 'coerce' or 'reject', got {errors!r}")
+
+    schema = SOURCE_SCHEMAS[table]
+    conformed = df.copy()
+    invalid = pd.Series(False, index=df.index)
+
+    for col, kind in schema.columns.items():
+        if col not in df.columns:
+            continue
+        converted = CONVERTERS[kind](df[col])
+        missing = converted.isna()
+        if col in schema.keys:
+            invalid |= missing
+        else:
+            invalid |= missing & df[col].notna()
+        conformed[col] = converted
+
+    mismatched = df[invalid]
+    if errors == "reject":
+        conformed = conformed[~invalid]
+    return conformed, mismatched
+
+
+def share_key_categories(frames):
+    """
+    Give every code key column the same CategoricalDtype in all frames that have it, so merges
+    between them compare integer category codes instead of Python strings.
+    """
+    frames = dict(frames)
+    for col in CODE_KEYS:
+        holders = [name for name, df in frames.items() if col in df.columns]
+        if len(holders) < 2:
+            continue
+        dtypes = {frames[name][col].dtype for name in holders}
+        if len(dtypes) == 1 and isinstance(next(iter(dtypes)), pd.CategoricalDtype):
+            continue
+
+        categories = pd.Index(pd.concat([frames[name][col].astype(object) for name in holders]).dropna().unique())
+        dtype = pd.CategoricalDtype(categories)
+        for name in holders:
+            frames[name] = frames[name].assign(**{col: frames[name][col].astype(object).astype(dtype)})
+    return frames
+
+
+def to_documents(df):
+    """Records with nulls as None and numpy/pandas scalars as Python values, ready for insert_many"""
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+
+# --- streaming Excel ingestion ---
+
+def iter_excel_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Stream the first sheet of a workbook as DataFrames of up to chunk_rows rows, without loading
+    the whole sheet. Every value arrives as read from the cell; dtypes come from the schema.
+    """
+    if not path.lower().endswith(".xlsx"):
+        # openpyxl cannot stream legacy .xls files
+        yield pd.read_excel(path, dtype=object)
+        return
+
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(col).strip() if col is not None else f"column_{i}" for i, col in enumerate(header)]
+
+        chunk = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            chunk.append(row[:len(header)])
+            if len(chunk) >= chunk_rows:
+                yield pd.DataFrame.from_records(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame.from_records(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def iter_source_chunks(path, table=None, chunk_rows=DEFAULT_CHUNK_ROWS, errors=None):
+    """
+    Stream a source workbook as (table, conformed, mismatched) chunks. The table comes from the
+    file name, or is sniffed from the header row; unknown workbooks are passed through as read.
+    """
+    table = table or table_for_name(path)
+    for chunk in iter_excel_chunks(path, chunk_rows):
+        table = table or sniff_table(chunk.columns)
+        if table is None:
+            yield None, chunk, chunk.iloc[0:0]
+            continue
+        conformed, mismatched = conform(chunk, table, errors)
+        yield table, conformed, mismatched
+
+
+def read_source_table(path, table=None, errors=None):
+    """Read a whole source workbook; returns (conformed, mismatched)"""
+    conformed, mismatched = [], []
+    for _, chunk, bad in iter_source_chunks(path, table, errors=errors):
+        conformed.append(chunk)
+        mismatched.append(bad)
+    if not conformed:
+        return pd.DataFrame(), pd.DataFrame()
+    return pd.concat(conformed, ignore_index=True), pd.concat(mismatched, ignore_index=True)